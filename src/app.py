@@ -1,11 +1,23 @@
 import streamlit as st
 import gspread
 from google.oauth2.service_account import Credentials
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 import pandas as pd
+import base64
+import csv
+import functools
+import gzip
+import hashlib
+import html
+import io
+import json
+import os
 import re
+import threading
 import time
+import unicodedata
+import uuid
 
 # ==========================================
 # 1. 設定 & 定数
@@ -41,12 +53,70 @@ CATEGORY_ICONS = {
     "その他": "🤔"
 }
 
+# 活動履歴シートのカラム構成
+ACTIVITY_HISTORY_HEADERS = ["id", "action_type", "entity_type", "entity_id", "entity_name", "old_value", "new_value", "details", "created_at"]
+
+# 活動履歴アーカイブ設定
+# 保持期間(日)より古い行を月別のアーカイブ (シート or ローカルgzip) へ移動する
+HISTORY_ARCHIVE_DEFAULT_DAYS = 90
+HISTORY_ARCHIVE_PREFIX = "activity_history_"  # 例: activity_history_202601
+HISTORY_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+
+# 同じ対象への同じ操作がこの分数以内に続いた場合は1件の履歴にまとめる
+# settingsの history_compact_minutes で指定（0 または未設定で無効）
+
+# ファビコンキャッシュ設定
+# 各ドメインのファビコンを1回だけ取得してディスクに保存し、data URIとしてインライン表示する
+FAVICON_SOURCE_URL = "https://www.google.com/s2/favicons?domain={domain}&sz=64"
+FAVICON_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "favicons")
+FAVICON_CACHE_TTL_SECONDS = 14 * 24 * 60 * 60
+FAVICON_CACHE_MAX_BYTES = 5 * 1024 * 1024
+FAVICON_FETCH_TIMEOUT = 3
+FAVICON_RETRY_SECONDS = 10 * 60
+
+# 検索インデックス（アイデア・全体検索）を全件から作り直す間隔（秒）
+# アプリ経由の追加・編集・削除は即時に差分反映され、シートの直接編集は更新検知で作り直すため、取りこぼし時の上限として使う
+SEARCH_INDEX_REFRESH_SECONDS = 600
+
+# 一覧画面の1ページあたりの表示件数
+PROJECT_PAGE_SIZE = 20
+IDEA_PAGE_SIZE = 20
+
+# 定期メンテナンス（アーカイブ等）の実行間隔
+MAINTENANCE_INTERVAL_HOURS = 24
+MAINTENANCE_LEASE_SECONDS = 15 * 60   # レプリカ間でメンテナンスの実行権を保持する上限
+
+# アイデアの一括インポートで1回のappend_rowsにまとめる行数
+IDEA_IMPORT_CHUNK_ROWS = 500
+
+# 同じ書き込みの再送（ダブルクリック・再実行）を無視する期間
+IDEMPOTENCY_TTL_SECONDS = 60
+
+# シート読み込みキャッシュの更新検知
+# スプレッドシートの最終更新日時（Drive APIのmodifiedTime）だけを定期的に確認し、変わったときだけ読み直す
+# 確認間隔は settings の refresh_poll_seconds で変更できる
+REFRESH_POLL_DEFAULT_SECONDS = 15
+SHEET_CACHE_MAX_AGE_SECONDS = 600   # 更新検知を取りこぼした場合の上限
+SHEET_CACHE_FALLBACK_SECONDS = 60   # 更新日時を取得できない環境での読み直し間隔
+
+# レプリカ間の共有キャッシュ（secrets の [shared_cache] で有効化）
+# backend = "sqlite"（共有ボリューム上のファイル）/ "redis"（Redis互換サービス）/ "local"（単一プロセスの代替）
+SHARED_CACHE_PREFIX = "cockpit:"
+
+# 論理削除: 削除時はこの列に日時を書くだけにし、行の物理削除は定期メンテナンスでまとめて行う
+SOFT_DELETE_COLUMN = "deleted_at"
+SOFT_DELETE_SHEETS = ("tasks", "ideas")
+
+# アイデアのCSVインポートでヘッダー行とみなす列名
+IDEA_IMPORT_KNOWN_COLUMNS = ("id", "content", "title", "created_at", SOFT_DELETE_COLUMN)
+
 # ==========================================
 # 2. CSS & UI コンポーネント
 # ==========================================
-def inject_custom_css():
-    st.markdown(f"""
-    <style>
+@st.cache_resource
+def build_custom_css():
+    """アプリ全体のCSSを生成する（プロセスごとに1回だけ組み立てる）"""
+    return f"""
     /* 全体設定 */
     .stApp {{
         background: {COLORS['bg_gradient']};
@@ -227,18 +297,71 @@ def inject_custom_css():
         margin-right: 8px;
         font-size: 1.2rem;
     }}
-    </style>
-    """, unsafe_allow_html=True)
 
-def inject_warpgate_scroll_script():
-    """ワープゲートexpanderが開かれたときに自動スクロールするJavaScriptを注入"""
-    try:
-        import streamlit.components.v1 as components
-        
-        # st.components.v1.htmlを使って確実に実行されるようにする
-        # 親ウィンドウのDOMにアクセスするため、window.parentを使用
-        components.html("""
-    <script>
+    /* ショートカットタイル (Quick Launch / ワープゲート共通) */
+    .shortcut-grid {{
+        display: grid;
+        grid-template-columns: repeat(var(--shortcut-cols, 6), minmax(0, 1fr));
+        gap: 0 12px;
+    }}
+    .shortcut-category {{
+        margin-top: 0.5rem;
+    }}
+    .shortcut-tile {{
+        text-align: center;
+        margin-bottom: 12px;
+        min-width: 0;
+    }}
+    .shortcut-tile a {{
+        text-decoration: none;
+        color: inherit;
+    }}
+    .shortcut-ring {{
+        width: 64px;
+        height: 64px;
+        margin: 0 auto 8px;
+        background: rgba(40, 40, 45, 0.8);
+        border-radius: 50%;
+        display: flex;
+        align-items: center;
+        justify-content: center;
+        border: 2px solid rgba(255, 255, 255, 0.1);
+        transition: all 0.2s;
+    }}
+    .shortcut-tile a:hover .shortcut-ring {{
+        background: rgba(0, 255, 255, 0.15);
+        border-color: {COLORS['accent_cyan']};
+        transform: translateY(-2px);
+        box-shadow: 0 0 15px rgba(0, 255, 255, 0.2);
+    }}
+    .shortcut-icon {{
+        width: 48px;
+        height: 48px;
+        background: white;
+        border-radius: 4px;
+        display: flex;
+        align-items: center;
+        justify-content: center;
+        font-size: 24px;
+    }}
+    .shortcut-icon img {{
+        width: 40px;
+        height: 40px;
+        object-fit: contain;
+    }}
+    .shortcut-label {{
+        color: {COLORS['text_main']};
+        font-size: 0.85em;
+        font-weight: 500;
+        white-space: nowrap;
+        overflow: hidden;
+        text-overflow: ellipsis;
+    }}
+    """
+
+# ワープゲートexpanderが開かれたときに自動スクロールするJavaScript
+# 親ウィンドウのDOMに<script>として常駐させるため、再実行ごとに再注入しない
+WARPGATE_SCROLL_SCRIPT = """
     (function() {
         try {
             // 親ウィンドウのDOMにアクセス（iframe内で実行される場合）
@@ -448,8 +571,49 @@ def inject_warpgate_scroll_script():
             // エラーは無視
         }
     })();
+"""
+
+@st.cache_resource
+def build_static_asset_loader():
+    """CSSとスクリプトを親ドキュメントの<head>へ1回だけ配置するローダーHTMLを生成する"""
+    def as_js_string(text):
+        # </script> などでHTMLが途切れないようにエスケープする
+        return json.dumps(text).replace("</", "<\\/")
+
+    return f"""
+    <script>
+    (function() {{
+        let targetDoc;
+        try {{
+            targetDoc = window.parent !== window ? window.parent.document : document;
+        }} catch (e) {{
+            targetDoc = document;
+        }}
+        if (!targetDoc.getElementById('cockpit-custom-css')) {{
+            const style = targetDoc.createElement('style');
+            style.id = 'cockpit-custom-css';
+            style.textContent = {as_js_string(build_custom_css())};
+            targetDoc.head.appendChild(style);
+        }}
+        if (!targetDoc.getElementById('cockpit-warpgate-script')) {{
+            const script = targetDoc.createElement('script');
+            script.id = 'cockpit-warpgate-script';
+            script.textContent = {as_js_string(WARPGATE_SCROLL_SCRIPT)};
+            targetDoc.head.appendChild(script);
+        }}
+    }})();
     </script>
-    """, height=0)
+    """
+
+def inject_static_assets():
+    """CSSとワープゲート用スクリプトをブラウザセッションごとに1回だけ注入する
+    どちらも親ドキュメントに常駐するので、2回目以降の再実行では何も送信しない"""
+    if st.session_state.get('static_assets_injected'):
+        return
+    try:
+        import streamlit.components.v1 as components
+        components.html(build_static_asset_loader(), height=0)
+        st.session_state['static_assets_injected'] = True
     except Exception as e:
         # エラーは無視
         pass
@@ -457,11 +621,400 @@ def inject_warpgate_scroll_script():
 # ==========================================
 # 3. データ管理クラス (SheetManager)
 # ==========================================
+def _row_from_append_response(response):
+    """append_rowのレスポンス (updates.updatedRange) から書き込まれた行番号を取り出す"""
+    try:
+        updated_range = response["updates"]["updatedRange"]
+        match = re.search(r"![A-Z]+(\d+)", updated_range)
+        return int(match.group(1)) if match else None
+    except (KeyError, TypeError):
+        return None
+
+
+class SettingsStore:
+    """settingsシート (key, value) をdictとして保持するストア
+    初回アクセス時に一度だけ読み込み、各キーの行番号を記憶して該当セルへ直接書き込む"""
+    SHEET_NAME = "settings"
+    HEADERS = ["key", "value"]
+    DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._values = None
+        self._rows = {}
+        self._next_row = 2
+        self._lock = threading.Lock()
+
+    def reload(self):
+        """シートを読み直してキャッシュを作り直す。読み込めた場合True
+        読み込みに失敗した場合はキャッシュを作らず、次回アクセス時に読み直す"""
+        try:
+            values = self._manager.spreadsheet.worksheet(self.SHEET_NAME).get_all_values()
+        except gspread.exceptions.WorksheetNotFound:
+            values = []
+        except Exception as e:
+            st.error(f"設定読み込みエラー: {e}")
+            return False
+
+        settings, rows = {}, {}
+        for row_num, row in enumerate(values[1:], start=2):
+            if not row or not str(row[0]).strip():
+                continue
+            # 同じキーの行が複数ある場合は、最も下の行（最後に追記された行）を正とする
+            key = str(row[0]).strip()
+            settings[key] = row[1] if len(row) > 1 else ""
+            rows[key] = row_num
+
+        with self._lock:
+            self._values = settings
+            self._rows = rows
+            self._next_row = max(len(values), 1) + 1
+        return True
+
+    def ensure_loaded(self):
+        """未読み込みなら読み込む。設定を利用できる場合True"""
+        return self._values is not None or self.reload()
+
+    def invalidate(self):
+        """次回アクセス時にシートから読み直す"""
+        with self._lock:
+            self._values = None
+
+    def get(self, key, default=None):
+        """値を返す。設定を読み込めない場合はdefaultを返す（状態を持つ値はensure_loadedで確認してから使う）"""
+        if not self.ensure_loaded():
+            return default
+        value = self._values.get(key)
+        if value is None or str(value).strip() == "":
+            return default
+        return value
+
+    def get_str(self, key, default=""):
+        return str(self.get(key, default))
+
+    def get_int(self, key, default=0):
+        try:
+            return int(float(self.get(key, default)))
+        except (TypeError, ValueError):
+            return default
+
+    def get_float(self, key, default=0.0):
+        try:
+            return float(self.get(key, default))
+        except (TypeError, ValueError):
+            return default
+
+    def get_bool(self, key, default=False):
+        value = self.get(key)
+        if value is None:
+            return default
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+    def get_datetime(self, key, default=None):
+        """'%Y-%m-%d %H:%M:%S' 形式の値をnaiveなdatetimeとして返す"""
+        value = self.get(key)
+        if value is None:
+            return default
+        try:
+            return datetime.strptime(str(value), self.DATETIME_FORMAT)
+        except ValueError:
+            return default
+
+    def set(self, key, value):
+        """既知のキーは記憶している行のセルを直接更新し、未知のキーは末尾に追記する
+        設定を読み込めていない場合は、既存の行を重複させないよう書き込まずにFalseを返す"""
+        if not self.ensure_loaded():
+            st.error(f"設定を読み込めないため '{key}' を更新できません")
+            return False
+        try:
+            row = self._rows.get(key)
+            if row:
+                sheet = self._manager.spreadsheet.worksheet(self.SHEET_NAME)
+                sheet.update_cell(row, 2, value)
+            else:
+                sheet = self._manager.ensure_sheet_exists(self.SHEET_NAME, self.HEADERS)
+                if not sheet:
+                    return False
+                response = sheet.append_row([key, value])
+                row = _row_from_append_response(response) or self._next_row
+                with self._lock:
+                    self._rows[key] = row
+                    self._next_row = max(self._next_row, row + 1)
+            with self._lock:
+                if self._values is not None:
+                    self._values[key] = str(value)
+            self._manager.mark_written(self.SHEET_NAME)
+            return True
+        except Exception as e:
+            st.error(f"設定更新エラー: {e}")
+            return False
+
+
+class IdempotencyTable:
+    """書き込みの冪等キーを短時間だけ記憶するプロセス内テーブル
+    同じキーの書き込みが期限内に再送された場合は2回目以降を無視する"""
+
+    def __init__(self, ttl_seconds=IDEMPOTENCY_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        for key in [k for k, expires in self._expires.items() if expires <= now]:
+            del self._expires[key]
+
+    def seen(self, key):
+        """期限内に記録済みのキーならTrue"""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            return key in self._expires
+
+    def claim(self, key):
+        """未使用のキーなら記録してTrue、期限内に記録済みならFalse"""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            if key in self._expires:
+                return False
+            self._expires[key] = now + self.ttl_seconds
+            return True
+
+    def release(self, key):
+        """書き込みに失敗したときにキーを解放し、再試行できるようにする"""
+        with self._lock:
+            self._expires.pop(key, None)
+
+
+class LocalCacheBackend:
+    """共有キャッシュのプロセス内版（単一プロセスでの動作確認・テスト用の代替）
+    シートごとにバージョンを持ち、値はバージョンが一致し期限内のときだけ返す"""
+
+    def __init__(self, ttl_seconds=SHEET_CACHE_MAX_AGE_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._versions = {}
+        self._entries = {}  # シート名 -> (バージョン, 期限, 値)
+        self._lock = threading.Lock()
+
+    def versions(self):
+        with self._lock:
+            return dict(self._versions)
+
+    def version(self, sheet_name):
+        with self._lock:
+            return self._versions.get(sheet_name, 0)
+
+    def get(self, sheet_name):
+        with self._lock:
+            entry = self._entries.get(sheet_name)
+            if entry and entry[0] == self._versions.get(sheet_name, 0) and entry[1] > time.time():
+                return entry[2]
+            return None
+
+    def set(self, sheet_name, version, values):
+        """読み込み前に確認したバージョンのまま変わっていなければ保存する"""
+        with self._lock:
+            if self._versions.setdefault(sheet_name, 0) == version:
+                self._entries[sheet_name] = (version, time.time() + self.ttl_seconds, values)
+
+    def bump(self, sheet_names=None):
+        """シートのバージョンを進めて他のレプリカのキャッシュを無効にする（省略時は全シート）
+        戻り値: 進めた後の {シート名: バージョン}"""
+        with self._lock:
+            for sheet_name in sheet_names or list(self._versions):
+                self._versions[sheet_name] = self._versions.get(sheet_name, 0) + 1
+            return dict(self._versions)
+
+
+class SQLiteCacheBackend:
+    """共有ボリューム上のSQLiteファイルを使う共有キャッシュ
+    他のレプリカの書き込みはバージョン表の確認（1回のSELECT）で検知する"""
+
+    def __init__(self, path, ttl_seconds=SHEET_CACHE_MAX_AGE_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sheet_versions (sheet TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS sheet_values (sheet TEXT PRIMARY KEY, version INTEGER NOT NULL, expires_at REAL NOT NULL, data BLOB NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def _connect(self):
+        import sqlite3
+        return sqlite3.connect(self.path, timeout=10)
+
+    def versions(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT sheet, version FROM sheet_versions").fetchall())
+
+    def version(self, sheet_name):
+        with self._connect() as conn:
+            row = conn.execute("SELECT version FROM sheet_versions WHERE sheet = ?", (sheet_name,)).fetchone()
+        return row[0] if row else 0
+
+    def get(self, sheet_name):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT v.data FROM sheet_values v WHERE v.sheet = ? AND v.expires_at > ?"
+                " AND v.version = COALESCE((SELECT version FROM sheet_versions WHERE sheet = v.sheet), 0)",
+                (sheet_name, time.time()),
+            ).fetchone()
+        return _decode_shared_values(row[0]) if row else None
+
+    def set(self, sheet_name, version, values):
+        with self._connect() as conn:
+            # 全シートのバージョンを進める対象に含めるため、バージョン表に登録しておく
+            conn.execute("INSERT OR IGNORE INTO sheet_versions (sheet, version) VALUES (?, 0)", (sheet_name,))
+            conn.execute(
+                "INSERT OR REPLACE INTO sheet_values (sheet, version, expires_at, data)"
+                " SELECT ?, ?, ?, ? WHERE COALESCE((SELECT version FROM sheet_versions WHERE sheet = ?), 0) = ?",
+                (sheet_name, version, time.time() + self.ttl_seconds, _encode_shared_values(values), sheet_name, version),
+            )
+
+    def bump(self, sheet_names=None):
+        with self._connect() as conn:
+            if sheet_names:
+                conn.executemany(
+                    "INSERT INTO sheet_versions (sheet, version) VALUES (?, 1)"
+                    " ON CONFLICT(sheet) DO UPDATE SET version = version + 1",
+                    [(sheet_name,) for sheet_name in sheet_names],
+                )
+            else:
+                conn.execute("UPDATE sheet_versions SET version = version + 1")
+            return dict(conn.execute("SELECT sheet, version FROM sheet_versions").fetchall())
+
+    def acquire_lease(self, name, ttl_seconds):
+        """レプリカ間で1つだけ持てるリースを取得する。取得できたら所有者トークン、他が保持中ならNone"""
+        owner = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND expires_at <= ?", (name, now))
+            conn.execute("INSERT OR IGNORE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)", (name, owner, now + ttl_seconds))
+            row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        return owner if row and row[0] == owner else None
+
+    def release_lease(self, name, owner):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+class RedisCacheBackend:
+    """Redis互換サービスを使う共有キャッシュ（redisパッケージが必要）
+    バージョンはハッシュで持ち、更新はpub/subで全レプリカへ通知して手元のバージョン表に反映する"""
+
+    def __init__(self, url, ttl_seconds=SHEET_CACHE_MAX_AGE_SECONDS, prefix=SHARED_CACHE_PREFIX):
+        import redis
+        self.ttl_seconds = ttl_seconds
+        self._client = redis.Redis.from_url(url)
+        self._versions_key = f"{prefix}versions"
+        self._values_prefix = f"{prefix}values:"
+        self._channel = f"{prefix}invalidate"
+        self._lease_prefix = f"{prefix}lease:"
+        self._lock = threading.Lock()
+        self._mirror = self._load_versions()
+        # 他のレプリカからの無効化通知を受け取り、手元のバージョン表を更新する
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self._channel: self._on_message})
+        self._listener = self._pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _load_versions(self):
+        return {k.decode("utf-8"): int(v) for k, v in self._client.hgetall(self._versions_key).items()}
+
+    def _on_message(self, message):
+        try:
+            sheet_name, _, version = message["data"].decode("utf-8").rpartition(":")
+            with self._lock:
+                if int(version) > self._mirror.get(sheet_name, 0):
+                    self._mirror[sheet_name] = int(version)
+        except (AttributeError, ValueError):
+            pass
+
+    def versions(self):
+        # 通知の受信スレッドが止まっている場合はRedisから読み直す
+        if not self._listener.is_alive():
+            with self._lock:
+                self._mirror = self._load_versions()
+        with self._lock:
+            return dict(self._mirror)
+
+    def version(self, sheet_name):
+        return int(self._client.hget(self._versions_key, sheet_name) or 0)
+
+    def get(self, sheet_name):
+        version, data = self._client.hmget(f"{self._values_prefix}{sheet_name}", "version", "data")
+        if data is None or int(version or -1) != self.version(sheet_name):
+            return None
+        return _decode_shared_values(data)
+
+    def set(self, sheet_name, version, values):
+        if self.version(sheet_name) != version:
+            return
+        key = f"{self._values_prefix}{sheet_name}"
+        pipe = self._client.pipeline()
+        # 全シートのバージョンを進める対象に含めるため、バージョン表に登録しておく
+        pipe.hsetnx(self._versions_key, sheet_name, 0)
+        pipe.hset(key, mapping={"version": version, "data": _encode_shared_values(values)})
+        pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+
+    def bump(self, sheet_names=None):
+        sheet_names = list(sheet_names or self._load_versions())
+        pipe = self._client.pipeline()
+        for sheet_name in sheet_names:
+            pipe.hincrby(self._versions_key, sheet_name, 1)
+        new_versions = pipe.execute()
+        for sheet_name, version in zip(sheet_names, new_versions):
+            self._client.publish(self._channel, f"{sheet_name}:{version}")
+        with self._lock:
+            self._mirror.update(zip(sheet_names, new_versions))
+            return dict(self._mirror)
+
+    def acquire_lease(self, name, ttl_seconds):
+        """レプリカ間で1つだけ持てるリースを取得する (SET NX PX)。取得できたら所有者トークン、他が保持中ならNone"""
+        owner = uuid.uuid4().hex
+        if self._client.set(f"{self._lease_prefix}{name}", owner, nx=True, px=int(ttl_seconds * 1000)):
+            return owner
+        return None
+
+    def release_lease(self, name, owner):
+        # 期限切れ後に他のレプリカが取得したリースは消さない
+        self._client.eval(
+            "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0",
+            1, f"{self._lease_prefix}{name}", owner,
+        )
+
+
+def _encode_shared_values(values):
+    return gzip.compress(json.dumps(values, ensure_ascii=False).encode("utf-8"))
+
+def _decode_shared_values(data):
+    return json.loads(gzip.decompress(data).decode("utf-8"))
+
+
 class SheetManager:
-    def __init__(self):
+    def __init__(self, shared_cache=None):
         self.credentials = self._get_credentials()
         self.client = self._auth()
         self.spreadsheet = self._get_spreadsheet()
+        self.settings = SettingsStore(self)
+        self.data_version = 0
+        self._subscribers = []
+        # 直前に書き込んだ活動履歴（連続編集の圧縮用）
+        self._last_history = None
+        self._history_lock = threading.Lock()
+        # 同じ書き込みの再送を弾くための冪等キー
+        self.idempotency = IdempotencyTable()
+        # 更新検知（スプレッドシートの最終更新日時）
+        self._refresh_subscribers = []
+        self._known_modified = None
+        self._wrote_since_poll = False
+        self._last_poll = 0.0
+        self._fallback_cleared_at = time.time()
+        self._poll_lock = threading.Lock()
+        # レプリカ間の共有キャッシュ（未設定ならNone）と、最後に確認したシートごとのバージョン
+        self.shared_cache = shared_cache
+        self._peer_changed = False
+        self._seen_versions = self._shared_cache_call("versions") or {}
         
     def _get_credentials(self):
         try:
@@ -494,70 +1047,548 @@ class SheetManager:
             st.error(f"接続エラー: {e}")
             st.stop()
 
-    @st.cache_data(ttl=60)
-    def get_records(_self, sheet_name):
+    @st.cache_data(ttl=SHEET_CACHE_MAX_AGE_SECONDS)
+    def get_values(_self, sheet_name):
+        """シートの全セルを取得する（シートごとに1回だけ読み込み、get_records / get_table はここから作る）
+        シートが無ければ空リスト。読み込みエラーはキャッシュせずに送出する"""
         try:
-            sheet = _self.spreadsheet.worksheet(sheet_name)
-            return sheet.get_all_records()
+            return _self._read_values(sheet_name)
         except gspread.exceptions.WorksheetNotFound:
             return []
+
+    @st.cache_data(ttl=SHEET_CACHE_MAX_AGE_SECONDS)
+    def get_records(_self, sheet_name):
+        try:
+            values = _self.get_values(sheet_name)
+            if not values:
+                return []
+            # get_all_recordsと同じく数値らしい値は数値に変換する。論理削除済みの行は除外する
+            headers = values[0]
+            width = len(headers)
+            records = [dict(zip(headers, gspread.utils.numericise_all((row + [""] * width)[:width]))) for row in values[1:]]
+            return [r for r in records if not r.get(SOFT_DELETE_COLUMN)]
         except Exception:
             return []
 
-    def clear_cache(self):
+    @st.cache_data(ttl=SHEET_CACHE_MAX_AGE_SECONDS)
+    def get_table(_self, sheet_name, include_deleted=False):
+        """シートをヘッダーとDataFrameの組で取得する
+        - DataFrameのindexはシート上の行番号（データは2行目から）
+        - 論理削除済みの行はinclude_deleted=Trueのときだけ含める（除外しても行番号は変わらない）
+        - created_at列はdatetimeに変換（解釈できない値はNaT）
+        - 旧形式のtitle列はcontent列に揃える"""
+        try:
+            values = _self.get_values(sheet_name)
+        except Exception:
+            return [], pd.DataFrame()
+        if not values:
+            return [], pd.DataFrame()
+
+        headers = values[0]
+        width = len(headers)
+        rows = [(row + [""] * width)[:width] for row in values[1:]]
+        df = pd.DataFrame(rows, columns=headers, index=pd.RangeIndex(2, len(rows) + 2))
+        if not include_deleted and SOFT_DELETE_COLUMN in df.columns:
+            df = df[df[SOFT_DELETE_COLUMN] == ""]
+
+        # 期待するカラム名を揃える（ideas: id, content, created_at）
+        if "content" not in df.columns and "title" in df.columns and sheet_name == "ideas":
+            df = df.rename(columns={"title": "content"})
+        if "created_at" in df.columns:
+            df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce")
+        return headers, df
+
+    def _read_values(self, sheet_name):
+        """シートの全セルを取得する。共有キャッシュが有効なら先にそちらを見る
+        値は読み込み前に確認したバージョンで保存し、読み込み中に他のレプリカが書き込んだ場合は保存しない"""
+        if self.shared_cache is not None:
+            version = self._shared_cache_call("version", sheet_name)
+            values = self._shared_cache_call("get", sheet_name) if version is not None else None
+            if values is not None:
+                return values
+        values = self.spreadsheet.worksheet(sheet_name).get_all_values()
+        if self.shared_cache is not None and version is not None:
+            self._shared_cache_call("set", sheet_name, version, values)
+        return values
+
+    def _shared_cache_call(self, method, *args):
+        """共有キャッシュを呼び出す。未設定や接続エラーのときはNoneを返し、シートを直接読む動作に戻す"""
+        if self.shared_cache is None:
+            return None
+        try:
+            return getattr(self.shared_cache, method)(*args)
+        except Exception:
+            return None
+
+    def clear_cache(self, *sheet_names, external=False):
+        """読み込みキャッシュを破棄する
+        sheet_names: 書き込んだシート。共有キャッシュではこのシートのバージョンだけを進める（省略時は全シート）
+        external: 外部（シートの直接編集・他のプロセス）の変更を検知して破棄する場合True"""
+        self._clear_read_caches()
+        # 集計などデータ由来のキャッシュはこの値をキーに含めて作り直す
+        self.data_version += 1
+        if external:
+            # 共有キャッシュにも古い値が残っているため、全シートのバージョンを進める
+            self._bump_shared_versions(None)
+        else:
+            self.mark_written(*sheet_names)
+
+    def _clear_read_caches(self):
+        self.get_values.clear()
         self.get_records.clear()
+        self.get_table.clear()
+
+    def _bump_shared_versions(self, sheet_names):
+        """共有キャッシュのバージョンを進めて他のレプリカに無効化を伝える
+        確認済みとして記録するのは自分が進めたシートの分だけ。他のレプリカの未確認の更新が挟まっていれば
+        記録せずに残し、sync_shared_cacheで検知させる"""
+        versions = self._shared_cache_call("bump", sheet_names)
+        if versions is None:
+            return
+        for sheet in sheet_names or list(versions):
+            if versions.get(sheet, 0) == self._seen_versions.get(sheet, 0) + 1:
+                self._seen_versions[sheet] = versions[sheet]
+
+    def sync_shared_cache(self):
+        """他のレプリカの書き込みで共有キャッシュのバージョンが進んでいれば、このプロセスのキャッシュを破棄する
+        戻り値: キャッシュを破棄した場合True"""
+        versions = self._shared_cache_call("versions")
+        if versions is None:
+            return False
+        changed = {sheet for sheet, version in versions.items() if self._seen_versions.get(sheet, 0) != version}
+        self._seen_versions = versions
+        if not changed:
+            return False
+        # 次の更新日時の確認で、この変更による更新日時の変化を外部の変更と誤認しないようにする
+        self._peer_changed = True
+
+        # 共有キャッシュ側は最新なので、バージョンを進めずにこのプロセスのキャッシュだけを破棄する
+        self._clear_read_caches()
+        self.data_version += 1
+        if SettingsStore.SHEET_NAME in changed:
+            self.settings.invalidate()
+        self._notify_external_change()
+        return True
+
+    def _notify_external_change(self):
+        for callback in list(self._refresh_subscribers):
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def mark_written(self, *sheet_names):
+        """自分の書き込みを記録し（更新検知で外部の変更と区別するため）、共有キャッシュのバージョンを進める
+        書き込みのたびにDrive APIは呼ばない。次の確認で最終更新者が自分なら自分の書き込みによる変化とみなす"""
+        self._bump_shared_versions(list(sheet_names) or None)
+        self._wrote_since_poll = True
+
+    def on_external_change(self, callback):
+        """外部の変更を検知したときに呼ぶコールバックを登録する（検索インデックスの作り直しなどに使う）"""
+        self._refresh_subscribers.append(callback)
+
+    def get_modified_time(self):
+        """スプレッドシートの最終更新日時と、最終更新者がこのサービスアカウントかどうかを1回のDrive APIで取得する
+        戻り値: (modifiedTime, 自分が最終更新者ならTrue)。取得できなければ (None, False)"""
+        try:
+            metadata = self.client.http_client.request(
+                "get",
+                f"{gspread.urls.DRIVE_FILES_API_V3_URL}/{self.spreadsheet.id}",
+                params={"supportsAllDrives": True, "fields": "modifiedTime,lastModifyingUser(me)"},
+            ).json()
+            return metadata.get("modifiedTime"), bool(metadata.get("lastModifyingUser", {}).get("me"))
+        except Exception:
+            return None, False
+
+    def check_for_updates(self):
+        """前回の確認から一定時間経っていれば、スプレッドシートの最終更新日時だけを確認する
+        自分の書き込み以外で更新されていればキャッシュを破棄し、次の読み込みでシートを読み直す
+        戻り値: キャッシュを破棄した場合True"""
+        interval = self.settings.get_int("refresh_poll_seconds", REFRESH_POLL_DEFAULT_SECONDS)
+        now = time.time()
+        if now - self._last_poll < interval:
+            return False
+        # 複数セッションから同時に呼ばれても確認は1回だけ
+        if not self._poll_lock.acquire(blocking=False):
+            return False
+        try:
+            self._last_poll = now
+            if self.shared_cache is not None:
+                self.sync_shared_cache()
+            peer_changed, self._peer_changed = self._peer_changed, False
+            wrote, self._wrote_since_poll = self._wrote_since_poll, False
+            modified, modified_by_me = self.get_modified_time()
+            if modified is None:
+                # 更新日時を取得できない環境では、一定時間ごとに読み直す
+                changed = now - self._fallback_cleared_at >= SHEET_CACHE_FALLBACK_SECONDS
+            elif modified == self._known_modified:
+                changed = False
+            else:
+                # 前回の確認以降に自分が書き込み、最終更新者も自分（このサービスアカウント）なら自分の書き込みによる変化
+                # 共有キャッシュのバージョンが他のレプリカの書き込みで進んでいれば、その書き込みによる変化とみなす
+                # （このプロセスのキャッシュはsync_shared_cacheで破棄済み。全シートのバージョンは進めない）
+                # それ以外（最終更新者が別のユーザー、または共有キャッシュの無い他のレプリカ）は外部の変更
+                # 初回の確認（比較する値が無い）だけは読み直さない
+                previous, self._known_modified = self._known_modified, modified
+                own_change = modified_by_me and (wrote or peer_changed)
+                changed = previous is not None and not own_change
+            if not changed:
+                return False
+
+            self._fallback_cleared_at = now
+            self.clear_cache(external=True)
+            self.settings.invalidate()
+        finally:
+            self._poll_lock.release()
+
+        self._notify_external_change()
+        return True
+
+    def subscribe(self, callback):
+        """書き込み通知を受け取るコールバックを登録する（検索インデックスの差分更新などに使う）
+        callback(sheet_name, action, id_val, values)
+        action: "add" / "update" / "delete"、values: 書き込んだ {列名: 値}（deleteではNone）"""
+        self._subscribers.append(callback)
+
+    def _notify(self, sheet_name, action, id_val, values=None):
+        for callback in list(self._subscribers):
+            try:
+                callback(sheet_name, action, str(id_val), values)
+            except Exception:
+                # 通知先のエラーで書き込み処理を失敗させない
+                pass
+
+    def is_replay(self, idempotency_key):
+        """この冪等キーの書き込みが直前に実行済みならTrue（採番などの前に確認して無駄な読み込みを避ける）"""
+        return bool(idempotency_key) and self.idempotency.seen(idempotency_key)
+
+    def _claim_write(self, idempotency_key):
+        """冪等キーを確保する。キー無しなら常にTrue、再送ならFalse"""
+        return not idempotency_key or self.idempotency.claim(idempotency_key)
+
+    def _release_write(self, idempotency_key):
+        if idempotency_key:
+            self.idempotency.release(idempotency_key)
 
-    def add_row(self, sheet_name, row_data):
+    def add_row(self, sheet_name, row_data, idempotency_key=None):
+        if not self._claim_write(idempotency_key):
+            return True
         try:
+            # 通知用のヘッダーは書き込み前のキャッシュから取得する
+            headers = self.get_table(sheet_name)[0] if self._subscribers else []
             sheet = self.spreadsheet.worksheet(sheet_name)
             sheet.append_row(row_data)
-            self.clear_cache()
+            self.clear_cache(sheet_name)
+            if headers and row_data:
+                self._notify(sheet_name, "add", row_data[0], dict(zip(headers, row_data)))
+            return True
+        except Exception as e:
+            self._release_write(idempotency_key)
+            st.error(f"追加エラー: {e}")
+            return False
+
+    def add_rows(self, sheet_name, rows, headers=None, idempotency_key=None):
+        """複数行を1回のappend_rowsで追加する
+        headers: 通知用のヘッダー（チャンクごとに呼ぶ場合は事前に取得したものを渡して再読み込みを避ける）"""
+        if not rows or not self._claim_write(idempotency_key):
+            return True
+        try:
+            if headers is None:
+                headers = self.get_table(sheet_name)[0] if self._subscribers else []
+            sheet = self.spreadsheet.worksheet(sheet_name)
+            sheet.append_rows(rows)
+            self.clear_cache(sheet_name)
+            if headers:
+                for row_data in rows:
+                    self._notify(sheet_name, "add", row_data[0], dict(zip(headers, row_data)))
             return True
         except Exception as e:
+            self._release_write(idempotency_key)
             st.error(f"追加エラー: {e}")
             return False
 
-    def update_cell_by_id(self, sheet_name, id_val, col_name, new_value):
+    def update_cell_by_id(self, sheet_name, id_val, col_name, new_value, idempotency_key=None):
+        if not self._claim_write(idempotency_key):
+            return True
         try:
             sheet = self.spreadsheet.worksheet(sheet_name)
             headers = sheet.row_values(1)
             try:
                 col_index = headers.index(col_name) + 1
             except ValueError:
+                self._release_write(idempotency_key)
                 st.error(f"列 '{col_name}' が見つかりません")
                 return False
 
             cell = sheet.find(str(id_val), in_column=1)
             if cell:
                 sheet.update_cell(cell.row, col_index, new_value)
-                self.clear_cache()
+                self.clear_cache(sheet_name)
+                self._notify(sheet_name, "update", id_val, {col_name: new_value})
                 return True
+            self._release_write(idempotency_key)
             return False
         except Exception as e:
+            self._release_write(idempotency_key)
             st.error(f"更新エラー: {e}")
             return False
 
+    def _row_numbers_by_id(self, sheet_name, ids):
+        """IDに対応するシート上の行番号を引く {id: 行番号}
+        キャッシュの行番号は古い可能性がある（直接編集・並べ替え・他のレプリカの物理削除）ため、
+        ID列（A列）だけを読み直して対応を取る。論理削除済みの行はキャッシュ済みのテーブルで除外する"""
+        wanted = {str(i) for i in ids}
+        _, df = self.get_table(sheet_name, include_deleted=True)
+        if SOFT_DELETE_COLUMN in df.columns:
+            wanted -= set(df.loc[df[SOFT_DELETE_COLUMN] != "", "id"].astype(str))
+        if not wanted:
+            return {}
+        id_column = self.spreadsheet.worksheet(sheet_name).col_values(1)
+        return {str(id_val): row for row, id_val in enumerate(id_column[1:], start=2) if str(id_val) in wanted}
+
+    def update_cells_by_ids(self, sheet_name, updates, idempotency_key=None):
+        """複数行・複数列の更新を1回のbatch_updateでまとめて書き込む
+        updates: {id: {列名: 値}}。実際に更新したIDのリストを返す（再送・失敗は空リスト）"""
+        if not self._claim_write(idempotency_key):
+            return []
+        try:
+            headers = self.get_table(sheet_name)[0]
+            rows = self._row_numbers_by_id(sheet_name, updates.keys())
+            data = []
+            for id_val, values in updates.items():
+                row = rows.get(str(id_val))
+                if not row:
+                    continue
+                for col_name, new_value in values.items():
+                    if col_name not in headers:
+                        self._release_write(idempotency_key)
+                        st.error(f"列 '{col_name}' が見つかりません")
+                        return []
+                    data.append({
+                        "range": gspread.utils.rowcol_to_a1(row, headers.index(col_name) + 1),
+                        "values": [[new_value]],
+                    })
+            if not data:
+                self._release_write(idempotency_key)
+                return []
+            sheet = self.spreadsheet.worksheet(sheet_name)
+            sheet.batch_update(data, value_input_option=gspread.utils.ValueInputOption.user_entered)
+            self.clear_cache(sheet_name)
+            updated = [id_val for id_val in updates if str(id_val) in rows]
+            for id_val in updated:
+                self._notify(sheet_name, "update", id_val, dict(updates[id_val]))
+            return updated
+        except Exception as e:
+            self._release_write(idempotency_key)
+            st.error(f"更新エラー: {e}")
+            return []
+
     def get_next_id(self, sheet_name):
-        records = self.get_records(sheet_name)
-        if not records:
-            return 1
-        ids = [int(r['id']) for r in records if str(r['id']).isdigit()]
-        return max(ids) + 1 if ids else 1
+        # アーカイブ済みの行のIDを再利用しないよう、記録済みの下限値も考慮する
+        if not self.settings.ensure_loaded():
+            raise RuntimeError(f"設定を読み込めないため {sheet_name} のIDを採番できません")
+        id_floor = self.settings.get_int(f"{sheet_name}_id_floor", 0)
+        # 論理削除済みでまだ残っている行のIDも使用中として扱う
+        _, df = self.get_table(sheet_name, include_deleted=True)
+        if df.empty or "id" not in df.columns:
+            return id_floor + 1
+        ids = pd.to_numeric(df["id"].where(df["id"].astype(str).str.isdigit()), errors="coerce")
+        max_id = ids.max()
+        return max(int(max_id) if pd.notna(max_id) else 0, id_floor) + 1
+
+    def reserve_ids(self, sheet_name, count):
+        """連続したIDをcount個確保し、先頭のIDを返す
+        {シート名}_id_floor を確保した末尾まで進めるので、書き込み前でも他の採番と重ならない"""
+        first_id = self.get_next_id(sheet_name)
+        if not self.settings.set(f"{sheet_name}_id_floor", first_id + count - 1):
+            raise RuntimeError(f"{sheet_name} のIDを確保できません")
+        return first_id
 
     def delete_row_by_id(self, sheet_name, id_val):
-        """id列（1列目）で行を特定して削除する"""
+        """id列（1列目）で行を特定して削除する（論理削除対象のシートはdeleted_atを書き込むだけ）"""
+        if sheet_name in SOFT_DELETE_SHEETS:
+            return self.delete_rows_by_ids(sheet_name, [id_val]) > 0
         try:
             sheet = self.spreadsheet.worksheet(sheet_name)
             cell = sheet.find(str(id_val), in_column=1)
             if cell:
                 sheet.delete_rows(cell.row)
-                self.clear_cache()
+                self.clear_cache(sheet_name)
+                self._notify(sheet_name, "delete", id_val)
                 return True
             return False
         except Exception as e:
             st.error(f"削除エラー: {e}")
             return False
 
+    def delete_rows_by_ids(self, sheet_name, ids, history=None, idempotency_key=None):
+        """複数のIDの行を1回のbatchUpdateでまとめて削除する。削除した行数を返す
+        論理削除対象のシートはdeleted_atの書き込みだけで済ませ、行番号を変えない
+        history: 活動履歴のエントリ（add_activity_historiesと同じ形式）。指定すると同じbatchUpdateで追記する"""
+        if not self._claim_write(idempotency_key):
+            return 0
+        try:
+            rows = self._row_numbers_by_id(sheet_name, ids)
+            if not rows:
+                self._release_write(idempotency_key)
+                return 0
+            sheet = self.spreadsheet.worksheet(sheet_name)
+            extra_requests, history_rows = [], []
+            # 行が見つかったIDの分だけ履歴に残す
+            history = [entry for entry in (history or []) if str(entry["entity_id"]) in rows]
+            with self._history_lock:
+                if history:
+                    history_sheet = self.ensure_sheet_exists("activity_history", ACTIVITY_HISTORY_HEADERS)
+                    if history_sheet:
+                        request, history_rows = self._history_append_request(history_sheet, history)
+                        extra_requests.append(request)
+                        self._last_history = None
+                if sheet_name in SOFT_DELETE_SHEETS:
+                    deleted = self._soft_delete_row_numbers(sheet, rows.values(), extra_requests)
+                else:
+                    deleted = self._delete_row_numbers(sheet, rows.values(), extra_requests)
+            self.clear_cache(sheet_name, *(["activity_history"] if history_rows else []))
+            for id_val in rows:
+                self._notify(sheet_name, "delete", id_val)
+            for row in history_rows:
+                self._notify("activity_history", "add", row[0], dict(zip(ACTIVITY_HISTORY_HEADERS, row)))
+            return deleted
+        except Exception as e:
+            self._release_write(idempotency_key)
+            st.error(f"削除エラー: {e}")
+            return 0
+
+    def _delete_row_numbers(self, sheet, row_numbers, extra_requests=None):
+        """指定した行番号の行を1回のbatchUpdateでまとめて削除する
+        行番号のずれを避けるため、連続区間にまとめて下から順に削除リクエストを並べる
+        extra_requests: 同じbatchUpdateで送る他のリクエスト（履歴の追記など）"""
+        requests, count = self._delete_dimension_requests(sheet, row_numbers)
+        if not requests:
+            return 0
+        self.spreadsheet.batch_update({"requests": requests + list(extra_requests or [])})
+        return count
+
+    def _delete_dimension_requests(self, sheet, row_numbers):
+        """行削除用のdeleteDimensionリクエストを作る。戻り値: (リクエストのリスト, 削除する行数)"""
+        rows = sorted(set(int(r) for r in row_numbers if int(r) > 1), reverse=True)
+        if not rows:
+            return [], 0
+
+        ranges = []
+        start = end = rows[0]
+        for row in rows[1:]:
+            if row == start - 1:
+                start = row
+            else:
+                ranges.append((start, end))
+                start = end = row
+        ranges.append((start, end))
+
+        requests = [{
+            "deleteDimension": {
+                "range": {
+                    "sheetId": sheet.id,
+                    "dimension": "ROWS",
+                    "startIndex": start - 1,
+                    "endIndex": end,
+                }
+            }
+        } for start, end in ranges]
+        return requests, len(rows)
+
+    def _ensure_soft_delete_column(self, sheet):
+        """deleted_at列が無ければ末尾に追加し、その列番号（1始まり）を返す"""
+        headers = self.get_table(sheet.title, include_deleted=True)[0]
+        if SOFT_DELETE_COLUMN in headers:
+            return headers.index(SOFT_DELETE_COLUMN) + 1
+        col = len(headers) + 1
+        if sheet.col_count < col:
+            sheet.add_cols(col - sheet.col_count)
+        sheet.update_cell(1, col, SOFT_DELETE_COLUMN)
+        return col
+
+    def _soft_delete_row_numbers(self, sheet, row_numbers, extra_requests=None):
+        """指定した行のdeleted_atに日時を書き込む（1回のbatchUpdate）。戻り値: 論理削除した行数"""
+        rows = sorted(set(int(r) for r in row_numbers if int(r) > 1))
+        if not rows:
+            return 0
+        col = self._ensure_soft_delete_column(sheet)
+        now_str = datetime.now(pytz.timezone('Asia/Tokyo')).strftime('%Y-%m-%d %H:%M:%S')
+        requests = [{
+            "updateCells": {
+                "start": {"sheetId": sheet.id, "rowIndex": row - 1, "columnIndex": col - 1},
+                "rows": [{"values": [{"userEnteredValue": {"stringValue": now_str}}]}],
+                "fields": "userEnteredValue",
+            }
+        } for row in rows]
+        self.spreadsheet.batch_update({"requests": requests + list(extra_requests or [])})
+        return len(rows)
+
+    def vacuum_deleted_rows(self):
+        """論理削除済みの行を全シート分まとめて1回のbatchUpdateで物理削除する。戻り値: 削除した件数"""
+        requests, floors, total = [], {}, 0
+        for sheet_name in SOFT_DELETE_SHEETS:
+            try:
+                sheet = self.spreadsheet.worksheet(sheet_name)
+                values = sheet.get_all_values()
+            except gspread.exceptions.WorksheetNotFound:
+                continue
+            if len(values) <= 1 or SOFT_DELETE_COLUMN not in values[0]:
+                continue
+            deleted_col = values[0].index(SOFT_DELETE_COLUMN)
+            tombstones = [(row_num, row) for row_num, row in enumerate(values[1:], start=2)
+                          if len(row) > deleted_col and row[deleted_col]]
+            if not tombstones:
+                continue
+            sheet_requests, count = self._delete_dimension_requests(sheet, [row_num for row_num, _ in tombstones])
+            requests += sheet_requests
+            total += count
+            deleted_ids = [int(row[0]) for _, row in tombstones if str(row[0]).isdigit()]
+            if deleted_ids:
+                floors[sheet_name] = max(deleted_ids)
+        if not requests:
+            return 0
+
+        try:
+            self.spreadsheet.batch_update({"requests": requests})
+        except Exception as e:
+            st.error(f"削除済み行の整理エラー: {e}")
+            return 0
+
+        # 物理削除したIDが再利用されないよう下限を記録
+        for sheet_name, max_id in floors.items():
+            if max_id > self.settings.get_int(f"{sheet_name}_id_floor", 0):
+                self.settings.set(f"{sheet_name}_id_floor", max_id)
+        self.clear_cache(*SOFT_DELETE_SHEETS)
+        return total
+
+    def _history_append_request(self, history_sheet, entries):
+        """活動履歴の行を追記するbatchUpdate用のappendCellsリクエストを作る
+        戻り値: (リクエスト, 追記する行のリスト)。IDはここで連番を割り当てる"""
+        rows = self._history_rows(entries, self.get_next_id("activity_history"))
+        return self._append_cells_request(history_sheet, rows), rows
+
+    @staticmethod
+    def _append_cells_request(sheet, rows):
+        """行を末尾に追記するbatchUpdate用のappendCellsリクエストを作る（整数以外は文字列のまま書き込む）"""
+        return {
+            "appendCells": {
+                "sheetId": sheet.id,
+                "rows": [{"values": [
+                    {"userEnteredValue": {"numberValue": value} if isinstance(value, int) else {"stringValue": str(value)}}
+                    for value in row
+                ]} for row in rows],
+                "fields": "userEnteredValue",
+            }
+        }
+
+    @staticmethod
+    def _rows_hold_ids(sheet, expected):
+        """ID列（A列）を読み直し、各行番号にまだ同じIDがあるか確認する
+        expected: {行番号: id}。読み込み後に行が追加・削除されてずれていればFalse"""
+        id_column = sheet.col_values(1)
+        return all(row <= len(id_column) and str(id_column[row - 1]) == str(id_val) for row, id_val in expected.items())
+
     def ensure_sheet_exists(self, sheet_name, headers):
         """シートが存在しない場合は作成し、ヘッダーを設定する"""
         try:
@@ -583,7 +1614,7 @@ class SheetManager:
             try:
                 sheet = self.spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=len(headers))
                 sheet.append_row(headers)
-                self.clear_cache()
+                self.clear_cache(sheet_name)
                 return sheet
             except Exception as e:
                 st.error(f"シート作成エラー: {e}")
@@ -603,99 +1634,640 @@ class SheetManager:
             
             new_id = self.get_next_id("project_comments_history")
             sheet.append_row([new_id, project_id, theme, memo, updated_at])
-            self.clear_cache()
+            self.clear_cache("project_comments_history")
             return True
         except Exception as e:
             st.error(f"履歴記録エラー: {e}")
             return False
 
-    def add_activity_history(self, action_type, entity_type, entity_id, entity_name, old_value="", new_value="", details=""):
+    def add_activity_history(self, action_type, entity_type, entity_id, entity_name, old_value="", new_value="", details="", idempotency_key=None):
         """すべての活動履歴を記録する汎用メソッド"""
+        if not self._claim_write(idempotency_key):
+            return True
         try:
-            headers = ["id", "action_type", "entity_type", "entity_id", "entity_name", "old_value", "new_value", "details", "created_at"]
-            sheet = self.ensure_sheet_exists("activity_history", headers)
+            sheet = self.ensure_sheet_exists("activity_history", ACTIVITY_HISTORY_HEADERS)
             if not sheet:
+                self._release_write(idempotency_key)
                 return False
             
-            new_id = self.get_next_id("activity_history")
             # get_now_jst()をインポートして使用
             from datetime import datetime
             import pytz
             now_str = datetime.now(pytz.timezone('Asia/Tokyo')).strftime('%Y-%m-%d %H:%M:%S')
             
-            sheet.append_row([new_id, action_type, entity_type, str(entity_id), entity_name, old_value, new_value, details, now_str])
-            self.clear_cache()
+            with self._history_lock:
+                # 直前の記録と同じ対象・同じ操作が短時間に続いた場合は、その行を上書きしてまとめる
+                last = self._last_history
+                window = self.settings.get_int("history_compact_minutes", 0)
+                if (window > 0 and last
+                        and last["key"] == (action_type, entity_type, str(entity_id))
+                        and datetime.strptime(now_str, '%Y-%m-%d %H:%M:%S') - last["created_at"] <= timedelta(minutes=window)
+                        # 他のレプリカのアーカイブ・圧縮で行がずれていれば上書きせず新しい行として追記する
+                        and str(sheet.acell(f"A{last['row']}").value) == str(last["id"])):
+                    sheet.update(
+                        range_name=f"E{last['row']}:I{last['row']}",
+                        values=[[entity_name, last["old_value"], new_value, details, now_str]],
+                    )
+                    last["created_at"] = datetime.strptime(now_str, '%Y-%m-%d %H:%M:%S')
+                    self.clear_cache("activity_history")
+                    self._notify("activity_history", "update", last["id"], {"entity_name": entity_name, "new_value": new_value})
+                    return True
+
+                new_id = self.get_next_id("activity_history")
+                response = sheet.append_row([new_id, action_type, entity_type, str(entity_id), entity_name, old_value, new_value, details, now_str])
+                row = _row_from_append_response(response)
+                self._last_history = {
+                    "key": (action_type, entity_type, str(entity_id)),
+                    "id": new_id,
+                    "row": row,
+                    "old_value": old_value,
+                    "created_at": datetime.strptime(now_str, '%Y-%m-%d %H:%M:%S'),
+                } if row else None
+            self.clear_cache("activity_history")
+            self._notify("activity_history", "add", new_id, dict(zip(ACTIVITY_HISTORY_HEADERS, [
+                new_id, action_type, entity_type, str(entity_id), entity_name, old_value, new_value, details, now_str])))
             return True
         except Exception as e:
+            self._release_write(idempotency_key)
             # エラーメッセージを詳細に表示
             import traceback
             st.error(f"履歴記録エラー: {e}")
             st.error(f"詳細: {traceback.format_exc()}")
             return False
 
-@st.cache_resource
-def get_sheet_manager():
-    return SheetManager()
+    def _history_rows(self, entries, first_id):
+        """活動履歴のエントリをシートの行に変換する（IDはfirst_idからの連番）"""
+        now_str = datetime.now(pytz.timezone('Asia/Tokyo')).strftime('%Y-%m-%d %H:%M:%S')
+        return [[
+            first_id + i,
+            entry["action_type"],
+            entry["entity_type"],
+            str(entry["entity_id"]),
+            entry["entity_name"],
+            entry.get("old_value", ""),
+            entry.get("new_value", ""),
+            entry.get("details", ""),
+            now_str,
+        ] for i, entry in enumerate(entries)]
 
-# ==========================================
-# 4. ヘルパー関数
-# ==========================================
-def get_now_jst():
-    return datetime.now(pytz.timezone('Asia/Tokyo')).strftime('%Y-%m-%d %H:%M:%S')
+    def add_activity_histories(self, entries, first_id=None, idempotency_key=None):
+        """複数の活動履歴を1回のappend_rowsでまとめて記録する
+        entries: add_activity_historyと同じキーワード（action_type, entity_type, entity_id, entity_name, old_value, new_value, details）の辞書のリスト
+        first_id: 事前に確保したIDブロックの先頭（省略時はここで採番する）"""
+        if not entries or not self._claim_write(idempotency_key):
+            return True
+        try:
+            sheet = self.ensure_sheet_exists("activity_history", ACTIVITY_HISTORY_HEADERS)
+            if not sheet:
+                self._release_write(idempotency_key)
+                return False
 
-def add_log(message):
-    if 'system_log' not in st.session_state:
-        st.session_state.system_log = []
-    time_str = datetime.now(pytz.timezone('Asia/Tokyo')).strftime('%H:%M:%S')
-    st.session_state.system_log.append(f"[{time_str}] {message}")
-    st.session_state.system_log = st.session_state.system_log[-20:]
+            with self._history_lock:
+                # IDは先頭の1回だけ採番し、連番で割り当てる
+                if first_id is None:
+                    first_id = self.get_next_id("activity_history")
+                rows = self._history_rows(entries, first_id)
+                sheet.append_rows(rows)
+                # まとめて書いた行は上書き集約の対象にしない
+                self._last_history = None
+            self.clear_cache("activity_history")
+            for row in rows:
+                self._notify("activity_history", "add", row[0], dict(zip(ACTIVITY_HISTORY_HEADERS, row)))
+            return True
+        except Exception as e:
+            self._release_write(idempotency_key)
+            st.error(f"履歴記録エラー: {e}")
+            return False
 
-def parse_links(text):
-    """リンクテキストからURLとラベルのペアを抽出する
-    戻り値: [(label, url), ...] のリスト
-    """
-    if not text:
-        return []
-    
-    links = []
-    lines = text.split('\n')
-    url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
-    markdown_link_pattern = re.compile(r'\[([^\]]+)\]\((https?://[^\)]+)\)')
-    
-    for line in lines:
+    def compact_activity_history(self, window_minutes=None):
+        """同じ対象・同じ操作が短時間に連続している履歴を1件にまとめるバッチ処理
+        最初のold_valueと最後のnew_valueを持つ1行を残し、残りは1回のbatchUpdateで削除する
+        戻り値: 削除した行数"""
+        if window_minutes is None:
+            window_minutes = self.settings.get_int("history_compact_minutes", 0)
+        if window_minutes <= 0:
+            return 0
+
+        try:
+            sheet = self.spreadsheet.worksheet("activity_history")
+            values = sheet.get_all_values()
+        except gspread.exceptions.WorksheetNotFound:
+            return 0
+        if len(values) <= 2:
+            return 0
+
+        headers = values[0]
+        try:
+            col = {name: headers.index(name) for name in ACTIVITY_HISTORY_HEADERS}
+        except ValueError:
+            st.warning("activity_historyの列構成が想定と異なるため圧縮をスキップしました。")
+            return 0
+
+        def cell(row, name):
+            return row[col[name]] if len(row) > col[name] else ""
+
+        window = timedelta(minutes=window_minutes)
+        updates = []
+        rows_to_delete = []
+        group = None  # {"row": 残す行番号, "key": ..., "old_value": ..., "last": 最後の行, "last_at": datetime, "size": 件数}
+
+        def flush(group):
+            if group and group["size"] > 1:
+                last = group["last"]
+                updates.append({
+                    "range": f"E{group['row']}:I{group['row']}",
+                    "values": [[cell(last, "entity_name"), group["old_value"], cell(last, "new_value"),
+                                cell(last, "details"), cell(last, "created_at")]],
+                })
+
+        for row_num, row in enumerate(values[1:], start=2):
+            key = (cell(row, "action_type"), cell(row, "entity_type"), cell(row, "entity_id"))
+            try:
+                created_at = datetime.strptime(cell(row, "created_at"), '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                created_at = None
+
+            if (group and created_at and key == group["key"]
+                    and created_at - group["last_at"] <= window):
+                group["last"] = row
+                group["last_at"] = created_at
+                group["size"] += 1
+                rows_to_delete.append(row_num)
+                continue
+
+            flush(group)
+            group = {"row": row_num, "key": key, "old_value": cell(row, "old_value"),
+                     "last": row, "last_at": created_at, "size": 1} if created_at else None
+        flush(group)
+
+        if not rows_to_delete:
+            return 0
+
+        try:
+            with self._history_lock:
+                sheet.batch_update(updates)
+                self._delete_row_numbers(sheet, rows_to_delete)
+                self._last_history = None
+        except Exception as e:
+            st.error(f"履歴圧縮エラー: {e}")
+            return 0
+
+        self.clear_cache("activity_history")
+        return len(rows_to_delete)
+
+    def archive_activity_history(self, horizon_days=None, target=None):
+        """保持期間より古い活動履歴を月別アーカイブへ移動し、ライブシートには直近分だけを残す
+        target: "sheet" (activity_history_YYYYMM シート) または "local" (HISTORY_ARCHIVE_DIR の gzip JSONL)
+        保存先は月ごとに history_archive_months へ記録するため、途中で保存先を変えても過去の月はそのまま読める
+        レプリカ間の共有キャッシュを使う構成では、ローカルのアーカイブは他のレプリカから読めないため "sheet" にする
+        戻り値: 移動した行数"""
+        if horizon_days is None:
+            horizon_days = self.settings.get_int("history_archive_days", HISTORY_ARCHIVE_DEFAULT_DAYS)
+        if target is None:
+            target = self.settings.get_str("history_archive_target", "sheet")
+        if target == "local" and self.shared_cache is not None and not isinstance(self.shared_cache, LocalCacheBackend):
+            st.warning("共有キャッシュ構成ではローカルへの履歴アーカイブは使えません。シートへアーカイブします。")
+            target = "sheet"
+
+        try:
+            sheet = self.spreadsheet.worksheet("activity_history")
+            values = sheet.get_all_values()
+        except gspread.exceptions.WorksheetNotFound:
+            return 0
+        if len(values) <= 1:
+            return 0
+
+        headers = values[0]
+        try:
+            created_col = headers.index("created_at")
+        except ValueError:
+            st.warning("activity_historyにcreated_at列がないためアーカイブをスキップしました。")
+            return 0
+
+        now_jst = datetime.now(pytz.timezone('Asia/Tokyo')).replace(tzinfo=None)
+        cutoff = now_jst - timedelta(days=horizon_days)
+
+        # 追記専用シートなので先頭から連続する古い行だけを対象にする（1回の行削除で済ませる）
+        old_rows = []
+        for row in values[1:]:
+            try:
+                created_at = datetime.strptime(row[created_col], '%Y-%m-%d %H:%M:%S')
+            except (IndexError, ValueError):
+                break
+            if created_at >= cutoff:
+                break
+            old_rows.append(row)
+        if not old_rows:
+            return 0
+
+        by_month = {}
+        for row in old_rows:
+            by_month.setdefault(row[created_col][:7].replace("-", ""), []).append(row)
+
+        try:
+            with self._history_lock:
+                # 読み込み後に行が増減していたら、位置で削除すると別の行を消すため今回は見送る
+                if not self._rows_hold_ids(sheet, {row_num: row[0] for row_num, row in enumerate(old_rows, start=2)}):
+                    st.warning("活動履歴が更新されたため、アーカイブを次回に延期しました。")
+                    return 0
+                append_requests = []
+                for month, rows in by_month.items():
+                    if target == "local":
+                        self._append_local_history_archive(month, headers, rows)
+                    else:
+                        archive_sheet = self.ensure_sheet_exists(f"{HISTORY_ARCHIVE_PREFIX}{month}", headers)
+                        if not archive_sheet:
+                            return 0
+                        append_requests.append(self._append_cells_request(archive_sheet, rows))
+                # シートへのアーカイブは追記と削除を1回のbatchUpdateで行う
+                self._delete_row_numbers(sheet, range(2, len(old_rows) + 2), append_requests)
+                self._last_history = None
+        except Exception as e:
+            st.error(f"履歴アーカイブエラー: {e}")
+            return 0
+
+        # アーカイブの所在（月ごとの保存先）と境界、IDの下限を記録
+        entries = {f"{month}:{archived_target}" for month, archived_target in self._history_archive_entries()}
+        entries.update(f"{month}:{target}" for month in by_month)
+        self.settings.set("history_archive_months", ",".join(sorted(entries)))
+        archived_before = max(row[created_col] for row in old_rows)
+        if archived_before > self.settings.get_str("history_archived_before", ""):
+            self.settings.set("history_archived_before", archived_before)
+        archived_ids = [int(r[0]) for r in old_rows if str(r[0]).isdigit()]
+        if archived_ids and max(archived_ids) > self.settings.get_int("activity_history_id_floor", 0):
+            self.settings.set("activity_history_id_floor", max(archived_ids))
+
+        self.clear_cache("activity_history")
+        return len(old_rows)
+
+    def archive_completed_tasks(self):
+        """完了済み('済')のタスクをtasks_archiveシートへまとめて移動する
+        追記と削除を1回のbatchUpdateで行う。戻り値: 移動した件数"""
+        try:
+            sheet = self.spreadsheet.worksheet("tasks")
+            values = sheet.get_all_values()
+        except gspread.exceptions.WorksheetNotFound:
+            return 0
+        if len(values) <= 1:
+            return 0
+
+        headers = values[0]
+        try:
+            status_col = headers.index("status")
+        except ValueError:
+            return 0
+
+        # 論理削除済みの行はアーカイブせず、定期メンテナンスの物理削除に任せる
+        deleted_col = headers.index(SOFT_DELETE_COLUMN) if SOFT_DELETE_COLUMN in headers else None
+        done = [(row_num, row) for row_num, row in enumerate(values[1:], start=2)
+                if len(row) > status_col and row[status_col] == '済'
+                and not (deleted_col is not None and len(row) > deleted_col and row[deleted_col])]
+        if not done:
+            return 0
+
+        keep_cols = [i for i, h in enumerate(headers) if i != deleted_col]
+        try:
+            archive_sheet = self.ensure_sheet_exists("tasks_archive", [headers[i] for i in keep_cols])
+            if not archive_sheet:
+                return 0
+            # 読み込み後に行が増減していたら、位置で削除すると別のタスクを消すため今回は見送る
+            if not self._rows_hold_ids(sheet, {row_num: row[0] for row_num, row in done}):
+                st.warning("タスクが更新されたため、完了タスクのアーカイブを次回に延期しました。")
+                return 0
+            append_request = self._append_cells_request(archive_sheet, [[row[i] if i < len(row) else "" for i in keep_cols] for _, row in done])
+            self._delete_row_numbers(sheet, [row_num for row_num, _ in done], [append_request])
+        except Exception as e:
+            st.error(f"タスクアーカイブエラー: {e}")
+            return 0
+
+        # アーカイブしたIDが再利用されないよう下限を記録
+        archived_ids = [int(row[0]) for _, row in done if str(row[0]).isdigit()]
+        if archived_ids and max(archived_ids) > self.settings.get_int("tasks_id_floor", 0):
+            self.settings.set("tasks_id_floor", max(archived_ids))
+
+        self.clear_cache("tasks", "tasks_archive")
+        return len(done)
+
+    def get_open_tasks(self):
+        """未完了タスクを取得する
+        完了タスクは定期的にtasks_archiveへ移動されるため、ライブシートはほぼ未完了タスクのみになる"""
+        return [t for t in self.get_records("tasks") if t.get('status') == '未']
+
+    def _append_local_history_archive(self, month, headers, rows):
+        os.makedirs(HISTORY_ARCHIVE_DIR, exist_ok=True)
+        path = os.path.join(HISTORY_ARCHIVE_DIR, f"{HISTORY_ARCHIVE_PREFIX}{month}.jsonl.gz")
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for row in rows:
+                record = dict(zip(headers, row + [""] * (len(headers) - len(row))))
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _history_archive_entries(self):
+        """記録済みの月別アーカイブを [(月, 保存先)] で返す
+        保存先の無い旧形式の月は、従来どおり history_archive_target の保存先にあるものとして扱う"""
+        legacy_target = self.settings.get_str("history_archive_target", "sheet")
+        entries = set()
+        for item in filter(None, self.settings.get_str("history_archive_months", "").split(",")):
+            month, _, target = item.partition(":")
+            entries.add((month, target or legacy_target))
+        return sorted(entries)
+
+    @st.cache_data(ttl=3600)
+    def _load_history_archive(_self, month, target, archived_before):
+        """月別アーカイブを読み込む（archived_beforeをキーに含め、追記されたら読み直す）"""
+        if target == "local":
+            path = os.path.join(HISTORY_ARCHIVE_DIR, f"{HISTORY_ARCHIVE_PREFIX}{month}.jsonl.gz")
+            if not os.path.exists(path):
+                return []
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        try:
+            return _self.spreadsheet.worksheet(f"{HISTORY_ARCHIVE_PREFIX}{month}").get_all_records()
+        except Exception:
+            return []
+
+    def get_activity_history(self, since=None, until=None):
+        """活動履歴を取得する。since がアーカイブ境界より古い場合のみ必要な月のアーカイブも読む
+        since / until: naiveなdatetime (JST) またはNone"""
+        since_str = since.strftime('%Y-%m-%d %H:%M:%S') if since else ""
+        until_str = until.strftime('%Y-%m-%d %H:%M:%S') if until else ""
+
+        records = []
+        archived_before = self.settings.get_str("history_archived_before", "")
+        if archived_before and (not since_str or since_str <= archived_before):
+            first_month = since_str[:7].replace("-", "") if since_str else ""
+            last_month = until_str[:7].replace("-", "") if until_str else "999999"
+            for month, target in self._history_archive_entries():
+                if first_month <= month <= last_month:
+                    records.extend(self._load_history_archive(month, target, archived_before))
+
+        records.extend(self.get_records("activity_history"))
+
+        if since_str or until_str:
+            records = [
+                r for r in records
+                if (not since_str or str(r.get('created_at', '')) > since_str)
+                and (not until_str or str(r.get('created_at', '')) <= until_str)
+            ]
+        return records
+
+@st.cache_resource
+def get_shared_cache_backend():
+    """secrets の [shared_cache] に応じた共有キャッシュを返す（未設定・接続できない場合はNone）
+    例: backend = "sqlite", path = "/mnt/shared/cockpit-cache.sqlite3"
+        backend = "redis", url = "redis://cache:6379/0"（redisパッケージが必要）"""
+    try:
+        config = dict(st.secrets["shared_cache"])
+    except Exception:
+        return None
+    backend = config.get("backend", "local")
+    ttl_seconds = int(config.get("ttl_seconds", SHEET_CACHE_MAX_AGE_SECONDS))
+    try:
+        if backend == "sqlite":
+            return SQLiteCacheBackend(config["path"], ttl_seconds)
+        if backend == "redis":
+            return RedisCacheBackend(config["url"], ttl_seconds, config.get("prefix", SHARED_CACHE_PREFIX))
+        if backend == "local":
+            return LocalCacheBackend(ttl_seconds)
+        st.warning(f"共有キャッシュの種類 '{backend}' は未対応です。共有キャッシュなしで動作します。")
+    except Exception as e:
+        st.warning(f"共有キャッシュを利用できません（共有キャッシュなしで動作します）: {e}")
+    return None
+
+def get_replica_count():
+    """secrets の [deployment] replicas（同じスプレッドシートを扱うレプリカ数、未設定なら1）"""
+    try:
+        return max(1, int(st.secrets["deployment"]["replicas"]))
+    except Exception:
+        return 1
+
+@st.cache_resource
+def get_sheet_manager():
+    return SheetManager(shared_cache=get_shared_cache_backend())
+
+# ==========================================
+# 4. ヘルパー関数
+# ==========================================
+# Streamlit 1.37以降は st.fragment、それ以前は st.experimental_fragment を使う
+# どちらも無い環境では通常の関数として実行する（ページ全体の再実行になる）
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+def rerun_fragment():
+    """フラグメント内から呼び出し、その領域だけを再実行する"""
+    try:
+        st.rerun(scope="fragment")
+    except TypeError:
+        # scope引数に未対応の古いStreamlit
+        st.rerun()
+
+def render_pager(total, key, page_size):
+    """ページ送りUIを描画し、現在ページの表示範囲 (start, end) を返す
+    現在のページ番号は st.session_state[key] に保持する"""
+    pages = max(1, -(-total // page_size))
+    page = min(max(st.session_state.get(key, 0), 0), pages - 1)
+
+    if pages > 1:
+        c_prev, c_info, c_next = st.columns([1, 3, 1])
+        with c_prev:
+            if st.button("◀ 前へ", key=f"{key}_prev", disabled=page == 0, use_container_width=True):
+                page -= 1
+        with c_next:
+            if st.button("次へ ▶", key=f"{key}_next", disabled=page >= pages - 1, use_container_width=True):
+                page += 1
+        with c_info:
+            st.caption(f"{page + 1} / {pages} ページ（全{total}件）")
+
+    st.session_state[key] = page
+    start = page * page_size
+    return start, min(start + page_size, total)
+
+def get_now_jst():
+    return datetime.now(pytz.timezone('Asia/Tokyo')).strftime('%Y-%m-%d %H:%M:%S')
+
+def add_log(message):
+    if 'system_log' not in st.session_state:
+        st.session_state.system_log = []
+    time_str = datetime.now(pytz.timezone('Asia/Tokyo')).strftime('%H:%M:%S')
+    st.session_state.system_log.append(f"[{time_str}] {message}")
+    st.session_state.system_log = st.session_state.system_log[-20:]
+
+def make_idempotency_key(form_key, *values):
+    """書き込みの冪等キーを作る（フォームキー + 入力内容のハッシュ + セッションID）
+    同じセッションで同じ内容を再送した場合だけ同じキーになる"""
+    session_id = st.session_state.setdefault("session_uuid", uuid.uuid4().hex)
+    digest = hashlib.sha256(json.dumps([str(v) for v in values], ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+    return f"{form_key}:{digest}:{session_id}"
+
+_maintenance_lock = threading.Lock()
+
+def run_periodic_maintenance(manager):
+    """アーカイブ等の定期メンテナンスを実行する（セッションごとに1回だけ判定し、前回実行から間隔が空いていれば実行）"""
+    if st.session_state.get('maintenance_checked'):
+        return
+    # ID の下限やアーカイブ月の一覧を書き換えるため、設定を読み込めないときは次の実行に回す
+    if not manager.settings.ensure_loaded():
+        return
+    st.session_state['maintenance_checked'] = True
+
+    def is_due():
+        now_jst = datetime.now(pytz.timezone('Asia/Tokyo')).replace(tzinfo=None)
+        last_run = manager.settings.get_datetime("maintenance_at")
+        return not (last_run and now_jst - last_run < timedelta(hours=MAINTENANCE_INTERVAL_HOURS))
+
+    if not is_due():
+        return
+    # 行を位置で削除する処理を含むため、レプリカ間で同時に実行しない
+    # 共有キャッシュ（SQLite/Redis）のリースで排他し、共有先の無い複数レプリカ構成では実行しない
+    shared_cache = manager.shared_cache
+    if isinstance(shared_cache, LocalCacheBackend):
+        shared_cache = None
+    if shared_cache is None and get_replica_count() > 1:
+        return
+
+    # 複数セッションが同時に実行しないようにする
+    if not _maintenance_lock.acquire(blocking=False):
+        return
+    lease = None
+    try:
+        if shared_cache is not None:
+            lease = manager._shared_cache_call("acquire_lease", "maintenance", MAINTENANCE_LEASE_SECONDS)
+            if not lease:
+                return
+            # リースを待つ間に他のレプリカが実行し終えていれば何もしない
+            if not manager.settings.reload() or not is_due():
+                return
+        if not manager.settings.set("maintenance_at", get_now_jst()):
+            return
+        vacuumed = manager.vacuum_deleted_rows()
+        if vacuumed:
+            add_log(f"削除済み行の整理: {vacuumed}件")
+        compacted = manager.compact_activity_history()
+        if compacted:
+            add_log(f"活動履歴圧縮: {compacted}件をまとめました")
+        archived = manager.archive_activity_history()
+        if archived:
+            add_log(f"活動履歴アーカイブ: {archived}件")
+        archived_tasks = manager.archive_completed_tasks()
+        if archived_tasks:
+            add_log(f"完了タスクアーカイブ: {archived_tasks}件")
+    finally:
+        if lease:
+            manager._shared_cache_call("release_lease", "maintenance", lease)
+        _maintenance_lock.release()
+
+@st.cache_data(max_entries=16)
+def build_throughput_frames(_manager, data_version, days, today):
+    """アナリティクス用の集計フレームを作る（データバージョン・期間・日付ごとに1回だけ計算）
+    today: 集計の最終日 (YYYY-MM-DD)。キャッシュキーに含め、日付が変わったら集計し直す
+    戻り値: {"tasks_per_day", "ideas_per_week", "project_heatmap"} のDataFrame辞書"""
+    end = pd.Timestamp(today).normalize()
+    start = end - pd.Timedelta(days=days - 1)
+
+    # --- 完了タスク数 / 日 (tasks + tasks_archive の completed_at) ---
+    tasks = _manager.get_records("tasks") + _manager.get_records("tasks_archive")
+    completed = pd.to_datetime(
+        pd.Series([t.get('completed_at', '') for t in tasks], dtype="object"),
+        format='%Y-%m-%d %H:%M:%S', errors='coerce'
+    ).dropna()
+    completed = completed[completed >= start]
+    tasks_per_day = (
+        completed.dt.floor('D').value_counts()
+        .reindex(pd.date_range(start, end, freq='D'), fill_value=0)
+        .rename("完了タスク").to_frame()
+    )
+
+    # --- 活動履歴 ---
+    history = pd.DataFrame(_manager.get_activity_history(since=start.to_pydatetime()))
+    if history.empty:
+        history = pd.DataFrame(columns=ACTIVITY_HISTORY_HEADERS)
+    history["created_at"] = pd.to_datetime(history["created_at"].astype(str), format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    history = history.dropna(subset=["created_at"])
+
+    # アイデア追加数 / 週
+    ideas = history.loc[history["action_type"] == "アイデア追加", "created_at"]
+    ideas_per_week = (
+        ideas.to_frame().set_index("created_at").assign(count=1)["count"]
+        .resample('W-MON', label='left', closed='left').sum()
+        .reindex(pd.date_range(start - pd.Timedelta(days=start.weekday()), end, freq='W-MON'), fill_value=0)
+        .rename("追加アイデア").to_frame()
+    )
+
+    # プロジェクト別の活動量ヒートマップ（期間が長い場合は週単位）
+    projects = history[history["entity_type"] == "projects"].copy()
+    bucket = 'D' if days <= 120 else 'W'
+    if projects.empty:
+        project_heatmap = pd.DataFrame(columns=["period", "project", "count"])
+    else:
+        projects["entity_id"] = projects["entity_id"].astype(str)
+        # テーマ名は変更されうるため、各プロジェクトの最新の名前で表示する
+        latest_names = projects.sort_values("created_at").groupby("entity_id")["entity_name"].last()
+        projects["period"] = projects["created_at"].dt.to_period(bucket).dt.start_time
+        project_heatmap = (
+            projects.groupby(["entity_id", "period"]).size().rename("count").reset_index()
+        )
+        project_heatmap["project"] = project_heatmap["entity_id"].map(latest_names).astype(str)
+        project_heatmap = project_heatmap[["period", "project", "count"]]
+
+    return {
+        "tasks_per_day": tasks_per_day,
+        "ideas_per_week": ideas_per_week,
+        "project_heatmap": project_heatmap,
+    }
+
+# リンク解析用の正規表現（モジュール読み込み時に1回だけコンパイル）
+URL_PATTERN = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+MARKDOWN_LINK_PATTERN = re.compile(r'\[([^\]]+)\]\((https?://[^\)]+)\)')
+
+@functools.lru_cache(maxsize=1024)
+def _parse_links_cached(text):
+    """リンクテキストを解析して ((label, url), ...) を返す（同じテキストは再解析しない）
+    対応形式:
+    - ラベル: https://example.com
+    - https://example.com ラベル
+    - https://example.com (ラベル)
+    - [ラベル](https://example.com) (Markdown形式)
+    """
+    links = []
+    for line in text.split('\n'):
         line = line.strip()
         if not line:
             continue
             
         # Markdown形式のリンクをチェック [ラベル](URL)
-        markdown_match = markdown_link_pattern.search(line)
+        markdown_match = MARKDOWN_LINK_PATTERN.search(line)
         if markdown_match:
-            label = markdown_match.group(1)
-            url = markdown_match.group(2)
-            links.append((label, url))
+            links.append((markdown_match.group(1), markdown_match.group(2)))
+            continue
+
+        # 通常のURLを検索
+        urls = URL_PATTERN.findall(line)
+        if not urls:
+            continue
+        url = urls[0]
+        # URLを除去した部分からラベルを抽出
+        remaining = line.replace(url, '').strip()
+        
+        # 形式1: "ラベル: URL" または "ラベル : URL"
+        if ':' in remaining:
+            label = remaining.split(':')[0].strip()
+        # 形式2: "URL ラベル" または "URL (ラベル)"
+        elif remaining.startswith('(') and remaining.endswith(')'):
+            label = remaining[1:-1].strip()
+        elif remaining:
+            # URLの後に続くテキストをラベルとして使用
+            label = remaining.strip()
         else:
-            # 通常のURLを検索
-            urls = url_pattern.findall(line)
-            if urls:
-                url = urls[0]
-                # URLを除去した部分からラベルを抽出
-                remaining = line.replace(url, '').strip()
-                
-                # 形式1: "ラベル: URL" または "ラベル : URL"
-                if ':' in remaining:
-                    label = remaining.split(':')[0].strip()
-                # 形式2: "URL ラベル" または "URL (ラベル)"
-                elif remaining.startswith('(') and remaining.endswith(')'):
-                    label = remaining[1:-1].strip()
-                elif remaining:
-                    # URLの後に続くテキストをラベルとして使用
-                    label = remaining.strip()
-                else:
-                    label = ""
-                
-                links.append((label, url))
-    
-    return links
+            label = ""
+        
+        links.append((label, url))
+    return tuple(links)
+
+def parse_links(text):
+    """リンクテキストからURLとラベルのペアを抽出する
+    戻り値: [(label, url), ...] のリスト（呼び出し側で変更できるよう毎回新しいリストを返す）
+    """
+    if not text:
+        return []
+    return list(_parse_links_cached(str(text)))
 
 def format_links(links):
     """リンクのリストを保存用のテキスト形式に変換する
@@ -714,58 +2286,12 @@ def format_links(links):
     
     return "\n".join(formatted)
 
-def extract_urls_as_html(text):
-    """テキスト内のURLをHTMLリンクに変換して返す
-    形式: 
-    - ラベル: https://example.com
-    - https://example.com ラベル
-    - https://example.com (ラベル)
-    - [ラベル](https://example.com) (Markdown形式)
-    """
-    if not text:
-        return ""
-    lines = text.split('\n')
+@functools.lru_cache(maxsize=1024)
+def _render_links_html(text):
     links_html = []
-    url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
-    markdown_link_pattern = re.compile(r'\[([^\]]+)\]\((https?://[^\)]+)\)')
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Markdown形式のリンクをチェック [ラベル](URL)
-        markdown_match = markdown_link_pattern.search(line)
-        if markdown_match:
-            label = markdown_match.group(1)
-            url = markdown_match.group(2)
-        else:
-            # 通常のURLを検索
-            urls = url_pattern.findall(line)
-            if urls:
-                url = urls[0]
-                # URLを除去した部分からラベルを抽出
-                remaining = line.replace(url, '').strip()
-                
-                # 形式1: "ラベル: URL" または "ラベル : URL"
-                if ':' in remaining:
-                    label = remaining.split(':')[0].strip()
-                # 形式2: "URL ラベル" または "URL (ラベル)"
-                elif remaining.startswith('(') and remaining.endswith(')'):
-                    label = remaining[1:-1].strip()
-                elif remaining:
-                    # URLの後に続くテキストをラベルとして使用
-                    label = remaining.strip()
-                else:
-                    label = "Link"
-            else:
-                continue
-        
-        if not label:
-            label = "Link"
-        
+    for label, url in _parse_links_cached(text):
         link_html = f"""
-        <a href="{url}" target="_blank" style="
+        <a href="{html.escape(url, quote=True)}" target="_blank" style="
             color: {COLORS['accent_cyan']};
             text-decoration: none;
             margin-right: 10px;
@@ -773,124 +2299,618 @@ def extract_urls_as_html(text):
             padding: 2px 6px;
             border-radius: 3px;
             font-size: 0.8rem;
-        ">🔗 {label}</a>
+        ">🔗 {html.escape(label or "Link")}</a>
         """
         links_html.append(link_html)
-            
     return "".join(links_html)
 
+def extract_urls_as_html(text):
+    """テキスト内のURLをHTMLリンクに変換して返す（parse_linksと同じ解析結果を使い、結果もキャッシュする）
+    形式: 
+    - ラベル: https://example.com
+    - https://example.com ラベル
+    - https://example.com (ラベル)
+    - [ラベル](https://example.com) (Markdown形式)
+    """
+    if not text:
+        return ""
+    return _render_links_html(str(text))
+
+def normalize_search_text(text):
+    """検索用にテキストを正規化する（全角/半角・大文字/小文字の揺れを吸収）"""
+    return " ".join(unicodedata.normalize("NFKC", str(text or "")).lower().split())
+
+class NgramIndex:
+    """文字n-gram (2-gram / 3-gram) による転置インデックス
+    分かち書きの無い日本語でも部分一致で検索でき、ドキュメント単位で追加・更新・削除できる"""
+
+    def __init__(self, sizes=(2, 3)):
+        self.sizes = sizes
+        self._postings = {}  # gram -> {doc_id: weight}
+        self._docs = {}      # doc_id -> {"grams": {gram: weight}, "text": 正規化済みテキスト}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._docs
+
+    def _grams(self, text):
+        grams = set()
+        for token in text.split():
+            for size in self.sizes:
+                grams.update(token[i:i + size] for i in range(len(token) - size + 1))
+        return grams
+
+    def add(self, doc_id, fields):
+        """ドキュメントを登録する（既存のものは置き換え）
+        fields: [(テキスト, 重み), ...]。同じn-gramが複数フィールドにある場合は大きい方の重みを使う"""
+        self.remove(doc_id)
+        grams = {}
+        texts = []
+        for text, weight in fields:
+            text = normalize_search_text(text)
+            if not text:
+                continue
+            texts.append(text)
+            for gram in self._grams(text):
+                grams[gram] = max(grams.get(gram, 0), weight)
+        self._docs[doc_id] = {"grams": grams, "text": "\n".join(texts)}
+        for gram, weight in grams.items():
+            self._postings.setdefault(gram, {})[doc_id] = weight
+
+    def remove(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if not doc:
+            return
+        for gram in doc["grams"]:
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[gram]
+
+    def search(self, query, limit=None, require_all=False):
+        """クエリに一致するドキュメントをスコア順に返す。戻り値: [(doc_id, score), ...]
+        require_all=False: n-gramの一致率によるあいまい検索（半分以上一致したものを返す）
+        require_all=True : 空白区切りの各語をすべて部分文字列として含むもの (AND検索)"""
+        query = normalize_search_text(query)
+        if not query:
+            return []
+
+        scores = {}
+        terms = query.split() if require_all else [query]
+        for term_no, term in enumerate(terms):
+            term_grams = self._grams(term)
+            if not term_grams:
+                # n-gramより短い語（1文字など）は本文の部分一致で判定する
+                matched = {doc_id: 1.0 for doc_id, doc in self._docs.items() if term in doc["text"]}
+            else:
+                hits = {}  # doc_id -> [一致したn-gram数, 重みの合計]
+                for gram in term_grams:
+                    for doc_id, weight in self._postings.get(gram, {}).items():
+                        hit = hits.setdefault(doc_id, [0, 0])
+                        hit[0] += 1
+                        hit[1] += weight
+                matched = {}
+                for doc_id, (count, weight) in hits.items():
+                    coverage = count / len(term_grams)
+                    exact = term in self._docs[doc_id]["text"]
+                    if require_all and not exact:
+                        continue
+                    if not require_all and coverage < 0.5 and not exact:
+                        continue
+                    # 一致率 × 重み（ラベル一致を優先）に、完全な部分一致のボーナスを加える
+                    matched[doc_id] = weight / len(term_grams) + (1.0 if exact else 0.0)
+
+            if require_all:
+                if term_no == 0:
+                    scores = matched
+                else:
+                    scores = {doc_id: scores[doc_id] + score for doc_id, score in matched.items() if doc_id in scores}
+                if not scores:
+                    return []
+            else:
+                scores = matched
+
+        results = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        return results[:limit] if limit else results
+
+class IdeaSearchIndex:
+    """アイデア本文の転置インデックス（プロセス内で全セッション共有）
+    追加・編集・削除はSheetManagerの書き込み通知で差分反映し、作り直さない。
+    シートが直接編集された場合に備え、一定時間ごとにだけ全件から作り直す"""
+
+    def __init__(self, manager, refresh_seconds=SEARCH_INDEX_REFRESH_SECONDS):
+        self._manager = manager
+        self._index = NgramIndex()
+        self._lock = threading.Lock()
+        self._built_at = None
+        self.refresh_seconds = refresh_seconds
+        manager.subscribe(self._on_write)
+        manager.on_external_change(self.invalidate)
+
+    def _rebuild(self):
+        _, df = self._manager.get_table("ideas")
+        index = NgramIndex()
+        if not df.empty and "id" in df.columns and "content" in df.columns:
+            for idea_id, content in zip(df["id"].astype(str), df["content"].astype(str)):
+                index.add(idea_id, [(content, 1)])
+        self._index = index
+        self._built_at = time.time()
+
+    def _on_write(self, sheet_name, action, id_val, values):
+        if sheet_name != "ideas":
+            return
+        with self._lock:
+            if self._built_at is None:
+                return
+            if action == "delete":
+                self._index.remove(id_val)
+                return
+            content = (values or {}).get("content", (values or {}).get("title"))
+            if content is not None:
+                self._index.add(id_val, [(content, 1)])
+
+    def invalidate(self):
+        """次回の検索時に全件から作り直す"""
+        with self._lock:
+            self._built_at = None
+
+    def search(self, query, limit=None):
+        """空白区切りの各語をすべて含むアイデアのIDを関連度順に返す (AND検索)"""
+        with self._lock:
+            if self._built_at is None or time.time() - self._built_at > self.refresh_seconds:
+                self._rebuild()
+            return [idea_id for idea_id, _ in self._index.search(query, limit=limit, require_all=True)]
+
+@st.cache_resource
+def get_idea_search_index(_manager):
+    """アイデア検索インデックスを取得する（全セッションで共有）"""
+    return IdeaSearchIndex(_manager)
+
+class GlobalSearchIndex:
+    """タスク・プロジェクト・アイデア・活動履歴を横断する検索インデックス（全セッションで共有）
+    ドキュメントは (entity_type, id) をキーに持ち、書き込み通知で差分反映する
+    活動履歴は対象ごとに最新の1件だけを ("activity_history", "対象の種類:対象のID") のキーで持ち、
+    索引の大きさが履歴の件数ではなく対象の数に比例するようにする"""
+
+    # シートごとの検索対象フィールドと重み
+    FIELDS = {
+        "tasks": [("title", 3), ("memo", 1)],
+        "projects": [("theme", 3), ("memo", 1), ("links", 1)],
+        "ideas": [("content", 2)],
+        "activity_history": [("entity_name", 1)],
+    }
+    # 検索結果の見出しに使うフィールド
+    TITLE_FIELDS = {
+        "tasks": "title",
+        "projects": "theme",
+        "ideas": "content",
+        "activity_history": "entity_name",
+    }
+
+    def __init__(self, manager, refresh_seconds=SEARCH_INDEX_REFRESH_SECONDS):
+        self._manager = manager
+        self._index = NgramIndex()
+        self._values = {}  # (entity_type, id) -> {列名: 値}
+        self._history_keys = {}  # 活動履歴のid -> 索引しているドキュメントのキー
+        self._lock = threading.Lock()
+        self._built_at = None
+        self.refresh_seconds = refresh_seconds
+        manager.subscribe(self._on_write)
+        manager.on_external_change(self.invalidate)
+
+    def _index_doc(self, key, values):
+        entity_type = key[0]
+        if entity_type == "ideas" and "content" not in values and "title" in values:
+            values = dict(values, content=values["title"])
+        self._values[key] = values
+        self._index.add(key, [(values.get(field, ""), weight) for field, weight in self.FIELDS[entity_type]])
+
+    def _doc_key(self, sheet_name, id_val, values):
+        """ドキュメントのキーを返す。活動履歴は対象 (entity_type, entity_id) ごとに1つ"""
+        if sheet_name != "activity_history":
+            return (sheet_name, id_val)
+        if values and "entity_type" in values and "entity_id" in values:
+            return (sheet_name, f"{values['entity_type']}:{values['entity_id']}")
+        return self._history_keys.get(id_val)
+
+    def _index_history(self, id_val, record):
+        key = self._doc_key("activity_history", id_val, record)
+        previous = self._values.get(key)
+        if previous is not None:
+            self._history_keys.pop(str(previous.get('id', '')), None)
+        self._history_keys[id_val] = key
+        self._index_doc(key, record)
+
+    def _rebuild(self):
+        self._index = NgramIndex()
+        self._values = {}
+        self._history_keys = {}
+        for entity_type in self.FIELDS:
+            for record in self._manager.get_records(entity_type):
+                id_val = str(record.get('id', '')).strip()
+                if not id_val:
+                    continue
+                if entity_type == "activity_history":
+                    # 追記順に並んでいるので、後の行で上書きすれば対象ごとに最新の1件が残る
+                    self._index_history(id_val, record)
+                else:
+                    self._index_doc((entity_type, id_val), record)
+        self._built_at = time.time()
+
+    def _on_write(self, sheet_name, action, id_val, values):
+        if sheet_name not in self.FIELDS:
+            return
+        with self._lock:
+            if self._built_at is None:
+                return
+            key = self._doc_key(sheet_name, id_val, values)
+            if key is None:
+                return
+            if action == "delete":
+                if sheet_name == "activity_history":
+                    # 索引している最新の1件が消えた場合だけ外す（同じ対象の古い履歴は索引していない）
+                    if self._history_keys.pop(id_val, None) is None:
+                        return
+                self._index.remove(key)
+                self._values.pop(key, None)
+            elif sheet_name == "activity_history" and action == "add":
+                self._index_history(id_val, dict(values or {}))
+            else:
+                # 更新通知は変更された列だけなので、既存の値とマージしてから索引し直す
+                self._index_doc(key, dict(self._values.get(key, {}), **(values or {})))
+
+    def invalidate(self):
+        """次回の検索時に全件から作り直す"""
+        with self._lock:
+            self._built_at = None
+
+    def search(self, query, limit=20):
+        """関連度順に [{"entity_type", "id", "title", "values", "score"}, ...] を返す
+        全語を含むもの (AND) を優先し、無ければあいまい検索の結果を返す"""
+        with self._lock:
+            if self._built_at is None or time.time() - self._built_at > self.refresh_seconds:
+                self._rebuild()
+            hits = self._index.search(query, limit=limit, require_all=True) or self._index.search(query, limit=limit)
+            results = []
+            for (entity_type, id_val), score in hits:
+                values = self._values.get((entity_type, id_val), {})
+                results.append({
+                    "entity_type": entity_type,
+                    "id": id_val,
+                    "title": str(values.get(self.TITLE_FIELDS[entity_type], "")),
+                    "values": values,
+                    "score": score,
+                })
+            return results
+
+@st.cache_resource
+def get_global_search_index(_manager):
+    """横断検索インデックスを取得する（全セッションで共有）"""
+    return GlobalSearchIndex(_manager)
+
+def normalize_url(url):
+    """比較用にURLを正規化する（スキーム・ホストの小文字化、www.・フラグメント・末尾スラッシュの除去）"""
+    from urllib.parse import urlsplit, urlunsplit
+    try:
+        parts = urlsplit(str(url).strip())
+    except ValueError:
+        return str(url).strip()
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), host, path, parts.query, ""))
+
+class LinkIndex:
+    """プロジェクトのリンクとショートカットを横断するリンク索引（全セッションで共有）
+    正規化URL -> プロジェクトID、ドメイン -> 正規化URL を保持し、同じURLの重複を1つにまとめる。
+    プロジェクトのlinks/theme更新は書き込み通知で差分反映する"""
+
+    def __init__(self, manager, refresh_seconds=SEARCH_INDEX_REFRESH_SECONDS):
+        self._manager = manager
+        self._lock = threading.Lock()
+        self._built_at = None
+        self.refresh_seconds = refresh_seconds
+        self._reset()
+        manager.subscribe(self._on_write)
+        manager.on_external_change(self.invalidate)
+
+    def _reset(self):
+        self._projects_by_url = {}   # 正規化URL -> {project_id}
+        self._urls_by_domain = {}    # ドメイン -> {正規化URL}
+        self._links_by_project = {}  # project_id -> {正規化URL}
+        self._themes = {}            # project_id -> テーマ名
+        self._shortcuts = {}         # 正規化URL -> ショートカットのラベル
+
+    def _add_url(self, url):
+        normalized = normalize_url(url)
+        domain = get_domain(normalized)
+        if domain:
+            self._urls_by_domain.setdefault(domain, set()).add(normalized)
+        return normalized
+
+    def _set_project_links(self, project_id, links_text):
+        for normalized in self._links_by_project.pop(project_id, set()):
+            projects = self._projects_by_url.get(normalized)
+            if projects is not None:
+                projects.discard(project_id)
+                if not projects:
+                    del self._projects_by_url[normalized]
+        urls = {self._add_url(url) for _, url in parse_links(links_text) if url}
+        self._links_by_project[project_id] = urls
+        for normalized in urls:
+            self._projects_by_url.setdefault(normalized, set()).add(project_id)
+
+    def _rebuild(self):
+        self._reset()
+        for proj in self._manager.get_records("projects"):
+            project_id = str(proj.get('id', ''))
+            if project_id:
+                self._themes[project_id] = str(proj.get('theme', ''))
+                self._set_project_links(project_id, proj.get('links', ''))
+        for shortcut in self._manager.get_records("shortcuts"):
+            if shortcut.get('url'):
+                self._shortcuts[self._add_url(shortcut['url'])] = str(shortcut.get('label', ''))
+        self._built_at = time.time()
+
+    def _ensure_fresh(self):
+        if self._built_at is None or time.time() - self._built_at > self.refresh_seconds:
+            self._rebuild()
+
+    def _on_write(self, sheet_name, action, id_val, values):
+        if sheet_name != "projects":
+            return
+        with self._lock:
+            if self._built_at is None:
+                return
+            if action == "delete":
+                self._set_project_links(id_val, "")
+                self._links_by_project.pop(id_val, None)
+                self._themes.pop(id_val, None)
+                return
+            values = values or {}
+            if "theme" in values:
+                self._themes[id_val] = str(values["theme"])
+            if "links" in values:
+                # format_linksで保存されたテキストを解析し直して差し替える
+                self._set_project_links(id_val, values["links"])
+
+    def invalidate(self):
+        """次回の参照時に全件から作り直す"""
+        with self._lock:
+            self._built_at = None
+
+    def projects_for_url(self, url):
+        """このURLを参照しているプロジェクトを [(project_id, theme), ...] で返す"""
+        with self._lock:
+            self._ensure_fresh()
+            project_ids = self._projects_by_url.get(normalize_url(url), set())
+            return sorted((pid, self._themes.get(pid, "")) for pid in project_ids)
+
+    def projects_for_domain(self, domain):
+        """このドメインのURLを参照しているプロジェクトを [(project_id, theme), ...] で返す"""
+        with self._lock:
+            self._ensure_fresh()
+            domain = str(domain).lower()
+            domain = domain[4:] if domain.startswith("www.") else domain
+            project_ids = set()
+            for normalized in self._urls_by_domain.get(domain, set()):
+                project_ids.update(self._projects_by_url.get(normalized, set()))
+            return sorted((pid, self._themes.get(pid, "")) for pid in project_ids)
+
+    def related_projects(self, project_id):
+        """同じURLを参照している他のプロジェクトを [(project_id, theme), ...] で返す"""
+        project_id = str(project_id)
+        with self._lock:
+            self._ensure_fresh()
+            related = set()
+            for normalized in self._links_by_project.get(project_id, set()):
+                related.update(self._projects_by_url.get(normalized, set()))
+            related.discard(project_id)
+            return sorted((pid, self._themes.get(pid, "")) for pid in related)
+
+    def shortcut_label(self, url):
+        """このURLがショートカットに登録されていればそのラベルを返す"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._shortcuts.get(normalize_url(url))
+
+@st.cache_resource
+def get_link_index(_manager):
+    """リンク索引を取得する（全セッションで共有）"""
+    return LinkIndex(_manager)
+
 # ==========================================
 # 5. コンポーネント (UIパーツ)
 # ==========================================
 
 def render_quick_launchpad(manager):
     """ヘッダー直下に配置する一軍リンク集（クイック・ランチパッド）"""
-    shortcuts = manager.get_records("shortcuts")
-    if not shortcuts:
-        return
-    
-    # placementが'header'のものだけ抽出
-    header_links = [s for s in shortcuts if str(s.get('placement', '')).lower() == 'header']
-    
-    if not header_links:
+    catalog = load_shortcut_catalog(manager)
+    if not catalog.header_items:
         return
     
     st.markdown("##### 🚀 Quick Launch")
-    
-    # 列数を計算 (最大6列程度で折り返し)
-    cols_num = min(len(header_links), 6)
-    cols = st.columns(cols_num)
-    
-    for i, item in enumerate(header_links):
-        col_idx = i % cols_num
-        with cols[col_idx]:
-            url = item.get('url', '#')
-            label = item.get('label', 'Link')
-            icon = item.get('icon', '🔗')
-            
-            # ファビコンURLを取得
-            favicon_url = get_favicon_url(url)
-            
-            # ファビコン＋ラベルの形式で表示
-            if favicon_url:
-                st.markdown(f"""
-                <div style="text-align:center; margin-bottom:12px;">
-                    <a href="{url}" target="_blank" style="text-decoration:none; color:inherit;">
-                        <div style="
-                            width:64px; height:64px; margin:0 auto 8px;
-                            background:rgba(40,40,45,0.8);
-                            border-radius:50%;
-                            display:flex; align-items:center; justify-content:center;
-                            border:2px solid rgba(255,255,255,0.1);
-                            transition: all 0.2s;
-                        " onmouseover="this.style.background='rgba(0,255,255,0.15)'; this.style.borderColor='#00FFFF'; this.style.transform='translateY(-2px)'; this.style.boxShadow='0 0 15px rgba(0,255,255,0.2)';" onmouseout="this.style.background='rgba(40,40,45,0.8)'; this.style.borderColor='rgba(255,255,255,0.1)'; this.style.transform='translateY(0)'; this.style.boxShadow='none';">
-                            <div style="
-                                width:48px; height:48px;
-                                background:white;
-                                border-radius:4px;
-                                display:flex; align-items:center; justify-content:center;
-                            ">
-                                <img src="{favicon_url}" 
-                                     style="width:40px; height:40px; object-fit:contain;" 
-                                     onerror="this.style.display='none'; this.parentElement.innerHTML='{icon}';" />
-                            </div>
-                        </div>
-                        <div style="
-                            color:{COLORS['text_main']};
-                            font-size:0.85em;
-                            font-weight:500;
-                            white-space: nowrap;
-                            overflow: hidden;
-                            text-overflow: ellipsis;
-                        ">{label}</div>
-                    </a>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                # ファビコンが取得できない場合はアイコンを表示
-                st.markdown(f"""
-                <div style="text-align:center; margin-bottom:12px;">
-                    <a href="{url}" target="_blank" style="text-decoration:none; color:inherit;">
-                        <div style="
-                            width:64px; height:64px; margin:0 auto 8px;
-                            background:rgba(40,40,45,0.8);
-                            border-radius:50%;
-                            display:flex; align-items:center; justify-content:center;
-                            border:2px solid rgba(255,255,255,0.1);
-                            transition: all 0.2s;
-                        " onmouseover="this.style.background='rgba(0,255,255,0.15)'; this.style.borderColor='#00FFFF'; this.style.transform='translateY(-2px)'; this.style.boxShadow='0 0 15px rgba(0,255,255,0.2)';" onmouseout="this.style.background='rgba(40,40,45,0.8)'; this.style.borderColor='rgba(255,255,255,0.1)'; this.style.transform='translateY(0)'; this.style.boxShadow='none';">
-                            <div style="
-                                width:48px; height:48px;
-                                background:white;
-                                border-radius:4px;
-                                display:flex; align-items:center; justify-content:center;
-                                font-size:24px;
-                            ">{icon}</div>
-                        </div>
-                        <div style="
-                            color:{COLORS['text_main']};
-                            font-size:0.85em;
-                            font-weight:500;
-                            white-space: nowrap;
-                            overflow: hidden;
-                            text-overflow: ellipsis;
-                        ">{label}</div>
-                    </a>
-                </div>
-                """, unsafe_allow_html=True)
+    st.markdown(catalog.header_html, unsafe_allow_html=True)
 
-def get_favicon_url(url):
-    """URLからファビコンURLを生成"""
+def get_domain(url):
+    """URLからドメインを取り出す"""
     try:
         from urllib.parse import urlparse
         parsed = urlparse(url)
-        domain = parsed.netloc or parsed.path.split('/')[0]
-        if domain:
-            # GoogleのファビコンAPIを使用
-            return f"https://www.google.com/s2/favicons?domain={domain}&sz=64"
+        return parsed.netloc or parsed.path.split('/')[0]
     except:
+        return ""
+
+class FaviconCache:
+    """ドメインごとのファビコンを一度だけ取得してディスクにキャッシュし、data URIとして返す
+    取得から ttl_seconds を過ぎたものは再取得し、合計サイズが max_bytes を超えたら
+    最後に使われたのが古いものから削除する (LRU)。取得に失敗した場合はNoneを返し、
+    retry_seconds の間はそのドメインを再取得しない
+    描画中は cached_data_uri でディスク上のものだけを使い、未取得・期限切れの分は prefetch で裏で取得する
+    （取得元 source_url を手元のHTTPサーバーに向ければ外部に出ずに動作を確認できる）"""
+
+    def __init__(self, cache_dir=FAVICON_CACHE_DIR, source_url=FAVICON_SOURCE_URL,
+                 ttl_seconds=FAVICON_CACHE_TTL_SECONDS, max_bytes=FAVICON_CACHE_MAX_BYTES,
+                 timeout=FAVICON_FETCH_TIMEOUT, retry_seconds=FAVICON_RETRY_SECONDS):
+        self.cache_dir = cache_dir
+        self.source_url = source_url
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        # 取得に失敗したドメイン -> 失敗時刻（retry_seconds の間は再取得しない）
+        self._failures = {}
+        # ディスク上のファビコンが新しいうちは再取得しない（ドメイン -> 期限。statを繰り返さないため）
+        self._fresh_until = {}
+        self._pending = set()
+        self._executor = None
+        # 裏での取得でファビコンが増えるたびに進める（描画済みHTMLのキャッシュキーに使う）
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def _path(self, domain):
+        return os.path.join(self.cache_dir, hashlib.sha1(domain.encode("utf-8")).hexdigest())
+
+    def _read(self, path):
+        """キャッシュファイル (1行目: Content-Type, 以降: 画像データ) を読み込み、最終利用時刻(atime)を更新する"""
+        try:
+            with open(path, "rb") as f:
+                content_type, _, data = f.read().partition(b"\n")
+            stat = os.stat(path)
+            os.utime(path, (time.time(), stat.st_mtime))
+            return content_type.decode("ascii"), data
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def _fetch(self, domain):
+        from urllib.parse import quote
+        from urllib.request import urlopen
+        with urlopen(self.source_url.format(domain=quote(domain)), timeout=self.timeout) as response:
+            content_type = response.headers.get_content_type() or "image/png"
+            data = response.read()
+        if not data or not content_type.startswith("image/"):
+            raise ValueError(f"invalid favicon response for {domain}")
+        return content_type, data
+
+    def _write(self, path, content_type, data):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content_type.encode("ascii") + b"\n" + data)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """合計サイズが上限を超えた分を、最終利用時刻の古い順に削除する"""
+        with self._lock:
+            try:
+                entries = []
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith(".tmp"):
+                        continue
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                    entries.append((stat.st_atime, stat.st_size, name))
+            except OSError:
+                return
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    total -= size
+                except OSError:
+                    pass
+
+    def get_data_uri(self, domain):
+        """ドメインのファビコンをdata URIで返す（キャッシュが無い/期限切れなら取得する）"""
+        if not domain:
+            return None
+        path = self._path(domain)
+        cached = self._read(path) if os.path.exists(path) else None
+        if cached and time.time() - os.stat(path).st_mtime < self.ttl_seconds:
+            return self._to_data_uri(*cached)
+
+        failed_at = self._failures.get(domain)
+        if failed_at and time.time() - failed_at < self.retry_seconds:
+            return self._to_data_uri(*cached) if cached else None
+
+        try:
+            content_type, data = self._fetch(domain)
+            self._write(path, content_type, data)
+            self._failures.pop(domain, None)
+            self._fresh_until[domain] = time.time() + self.ttl_seconds
+            return self._to_data_uri(content_type, data)
+        except Exception:
+            self._failures[domain] = time.time()
+            # 期限切れでも手元にあればそれを使う
+            return self._to_data_uri(*cached) if cached else None
+
+    def cached_data_uri(self, domain):
+        """ディスクにあるファビコンをdata URIで返す（取得はしない。無ければNone）"""
+        if not domain:
+            return None
+        path = self._path(domain)
+        cached = self._read(path) if os.path.exists(path) else None
+        return self._to_data_uri(*cached) if cached else None
+
+    def _needs_fetch(self, domain, now):
+        if domain in self._pending:
+            return False
+        failed_at = self._failures.get(domain)
+        if failed_at and now - failed_at < self.retry_seconds:
+            return False
+        if domain not in self._fresh_until:
+            try:
+                self._fresh_until[domain] = os.stat(self._path(domain)).st_mtime + self.ttl_seconds
+            except OSError:
+                self._fresh_until[domain] = 0
+        return self._fresh_until[domain] <= now
+
+    def prefetch(self, domains, max_workers=8):
+        """未取得・期限切れのファビコンをバックグラウンドで取得する（呼び出し元は待たない）
+        取得できたら generation を進める。再取得待ちを過ぎた失敗記録はここで捨てる"""
+        from concurrent.futures import ThreadPoolExecutor
+        now = time.time()
+        with self._lock:
+            for domain in [d for d, failed_at in self._failures.items() if now - failed_at >= self.retry_seconds]:
+                del self._failures[domain]
+            targets = sorted(d for d in set(domains) if d and self._needs_fetch(d, now))
+            if not targets:
+                return
+            self._pending.update(targets)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="favicon")
+        for domain in targets:
+            self._executor.submit(self._prefetch_one, domain)
+
+    def _prefetch_one(self, domain):
+        fetched = False
+        try:
+            fetched = self.get_data_uri(domain) is not None
+        finally:
+            with self._lock:
+                self._pending.discard(domain)
+                if fetched and domain not in self._failures:
+                    self.generation += 1
+
+    @staticmethod
+    def _to_data_uri(content_type, data):
+        return f"data:{content_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+@st.cache_resource
+def get_favicon_cache():
+    """ファビコンキャッシュを取得する（取得元は secrets の [favicon] source_url で差し替え可能）"""
+    source_url = FAVICON_SOURCE_URL
+    try:
+        source_url = st.secrets["favicon"]["source_url"]
+    except Exception:
         pass
-    return None
+    return FaviconCache(source_url=source_url)
 
 def truncate_label(label, max_length=6):
     """ラベルを指定文字数に切り詰め（日本語対応）"""
@@ -900,201 +2920,196 @@ def truncate_label(label, max_length=6):
         return label
     return label[:max_length] + "..."
 
+def render_shortcut_tile(url, label, icon="🔗", favicon_url=None):
+    """ショートカット1件分のタイルHTML（ファビコン＋ラベル）を生成する
+    見た目はCSSクラス (shortcut-*) で定義し、要素ごとのインラインスタイルは持たない"""
+    url = html.escape(str(url or '#'), quote=True)
+    label = html.escape(str(label or ''))
+    icon = html.escape(str(icon or '🔗'), quote=True)
+
+    if favicon_url:
+        # 読み込みに失敗した場合はアイコン文字に差し替える
+        inner = (f'<img src="{html.escape(favicon_url, quote=True)}" data-icon="{icon}" '
+                 f'onerror="this.parentElement.textContent=this.dataset.icon;" />')
+    else:
+        # ファビコンが取得できない場合はアイコンを表示
+        inner = icon
+
+    return (f'<div class="shortcut-tile"><a href="{url}" target="_blank">'
+            f'<div class="shortcut-ring"><div class="shortcut-icon">{inner}</div></div>'
+            f'<div class="shortcut-label">{label}</div></a></div>')
+
+def render_shortcut_grid(tiles, columns=6):
+    """タイルHTMLのリストをグリッド1つにまとめる"""
+    return f'<div class="shortcut-grid" style="--shortcut-cols:{columns};">{"".join(tiles)}</div>'
+
+class ShortcutCatalog:
+    """shortcutsシートから組み立てる表示用カタログ
+    カテゴリ別の分類・Quick Launch対象・ドメイン・描画済みHTMLを保持し、
+    Quick Launchとワープゲートの両方がここから読み出す"""
+
+    def __init__(self, records):
+        self.items = []
+        self.categories = {}      # カテゴリ名 -> items（出現順を維持）
+        self.uncategorized = []   # カテゴリが空欄のitems
+        self.header_items = []    # placementが'header'のitems
+
+        # ファビコンはディスクにある分だけをdata URIとしてタイルに埋め込む（無いものは絵文字アイコンで表示）
+        domains = [get_domain(str(record.get('url', '#') or '#')) for record in records]
+        self.domains = sorted(set(filter(None, domains)))
+        favicon_cache = get_favicon_cache()
+        favicons = {domain: favicon_cache.cached_data_uri(domain) for domain in self.domains}
+
+        for record, domain in zip(records, domains):
+            url = str(record.get('url', '#') or '#')
+            label = str(record.get('label', 'Link'))
+            icon = record.get('icon', '🔗')
+            category = str(record.get('category', '') or '')
+            favicon_url = favicons.get(domain)
+            item = {
+                "url": url,
+                "label": label,
+                "icon": icon,
+                "category": category,
+                "domain": domain,
+                "placement": str(record.get('placement', '')).lower(),
+                "tile_html": render_shortcut_tile(url, label, icon, favicon_url),
+                # ワープゲート用（ラベルを6文字に切り詰め）
+                "short_tile_html": render_shortcut_tile(url, truncate_label(label, 6), icon, favicon_url),
+            }
+            self.items.append(item)
+            if category.strip():
+                self.categories.setdefault(category, []).append(item)
+            else:
+                self.uncategorized.append(item)
+            if item["placement"] == 'header':
+                self.header_items.append(item)
+
+        # Quick Launch (最大6列程度で折り返し)
+        self.header_html = render_shortcut_grid(
+            [item["tile_html"] for item in self.header_items],
+            columns=min(len(self.header_items), 6) or 1,
+        )
+
+        # ワープゲート（全カテゴリを1ブロックにまとめる）
+        sections = []
+        for category, items in self.categories.items():
+            grid = render_shortcut_grid([item["short_tile_html"] for item in items])
+            sections.append(f'<h3 class="shortcut-category">📂 {html.escape(category)}</h3>{grid}<hr/>')
+        if self.uncategorized:
+            grid = render_shortcut_grid([item["short_tile_html"] for item in self.uncategorized])
+            sections.append(f'<h3 class="shortcut-category">📌 その他</h3>{grid}')
+        self.library_html = "".join(sections)
+
+        # ラベル・カテゴリ・URLの検索インデックス
+        self.search_index = NgramIndex()
+        for item_no, item in enumerate(self.items):
+            self.search_index.add(item_no, [(item["label"], 3), (item["category"], 2), (item["url"], 1)])
+
+    def search(self, query, limit=30):
+        """ラベル・カテゴリ・URLから部分一致/あいまい検索し、スコア順のitemsを返す"""
+        return [self.items[item_no] for item_no, _ in self.search_index.search(query, limit=limit)]
+
+@st.cache_resource(max_entries=4)
+def get_shortcut_catalog(_manager, data_version, favicon_generation=0):
+    """ショートカットカタログを取得する（データバージョンごとに1回だけ構築）
+    favicon_generation: 裏でファビコンを取得できたら作り直すためのキー"""
+    return ShortcutCatalog(_manager.get_records("shortcuts"))
+
+def load_shortcut_catalog(manager):
+    """ショートカットカタログを取得し、足りないファビコンをバックグラウンドで取りに行く"""
+    favicon_cache = get_favicon_cache()
+    catalog = get_shortcut_catalog(manager, manager.data_version, favicon_cache.generation)
+    favicon_cache.prefetch(catalog.domains)
+    return catalog
+
 def show_warpgate_modal_content(manager):
-    """モーダルウィンドウ内に全リンクを表示（Quick Launchの項目も含む）"""
-    shortcuts = manager.get_records("shortcuts")
-    if not shortcuts:
+    """モーダルウィンドウ内に全リンクを表示（Quick Launchの項目も含む）
+    全カテゴリを1つのHTMLブロックとして描画するため、リンク数が増えても要素数は増えない"""
+    catalog = load_shortcut_catalog(manager)
+    if not catalog.items:
         st.info("ショートカット設定がありません")
         return
     
-    df = pd.DataFrame(shortcuts)
-    
-    # 全てのリンクを表示（placementが'header'のものも含む）
-    library_links = df
-    
-    if library_links.empty:
-        st.info("ワープゲートに表示するリンクがありません")
+    st.caption("全てのブックマークへのアクセス")
+    query = st.text_input("🔍 リンクを検索", key="warpgate_search", placeholder="ラベル・カテゴリ・URLで検索")
+    if query:
+        # 検索中はヒットしたリンクだけを描画する
+        hits = catalog.search(query)
+        if not hits:
+            st.info("該当するリンクがありません")
+            return
+        st.markdown(render_shortcut_grid([item["tile_html"] for item in hits]), unsafe_allow_html=True)
+        # ヒットしたリンクのドメインを参照しているプロジェクト（リンク索引から逆引き）
+        link_index = get_link_index(manager)
+        referencing = {}
+        for item in hits:
+            for project_id, theme in link_index.projects_for_domain(item["domain"]):
+                referencing[project_id] = theme
+        if referencing:
+            st.caption("📁 関連プロジェクト: " + " / ".join(referencing.values()))
+        return
+    st.markdown(catalog.library_html, unsafe_allow_html=True)
+
+@fragment
+def render_global_search(manager):
+    """サイドバー：タスク・プロジェクト・アイデア・活動履歴の横断検索（入力ごとにこの領域だけ再実行）"""
+    query = st.text_input("🔎 全体検索", key="global_search_query", placeholder="タスク・プロジェクト・アイデアを検索")
+    if not query:
+        return
+    results = get_global_search_index(manager).search(query, limit=10)
+    if not results:
+        st.caption("該当する項目がありません")
+        return
+
+    entity_labels = {
+        "tasks": ("📝", "タスク"),
+        "projects": ("📁", "プロジェクト"),
+        "ideas": ("💡", "アイデア"),
+        "activity_history": ("🕒", "履歴"),
+    }
+    for result in results:
+        icon, type_label = entity_labels[result["entity_type"]]
+        title = truncate_label(result["title"].replace("\n", " "), 24) or "(無題)"
+        if result["entity_type"] == "activity_history":
+            # 履歴は移動先が無いため内容のみ表示
+            values = result["values"]
+            st.caption(f"{icon} {values.get('action_type', '')}: {title} ({values.get('created_at', '')})")
+            continue
+        if st.button(f"{icon} {title}", key=f"global_search_{result['entity_type']}_{result['id']}",
+                     help=f"{type_label}を開く", use_container_width=True):
+            if result["entity_type"] == "tasks":
+                st.session_state['current_page'] = "DASHBOARD"
+            elif result["entity_type"] == "projects":
+                st.session_state['current_page'] = "CAMPAIGN"
+                st.session_state.setdefault('open_project_ids', set()).add(result["id"])
+                st.session_state['focus_project_id'] = result["id"]
+            elif result["entity_type"] == "ideas":
+                st.session_state['current_page'] = "ASSETS"
+                st.session_state['ideas_keyword'] = result["values"].get("content", "")[:30]
+            st.rerun()
+
+@fragment
+def render_link_launcher(manager):
+    """サイドバー：リンクをキーワードで探してすぐ開くランチャー（入力ごとにこの領域だけ再実行）"""
+    query = st.text_input("🔍 クイック起動", key="link_launcher_query", placeholder="リンク名で検索して Enter")
+    if not query:
         return
-    
-    st.caption("全てのブックマークへのアクセス")
-    
-    # カテゴリごとに分類表示
-    if 'category' in library_links.columns:
-        categories = library_links['category'].astype(str).fillna("").unique()
-        categories = [c for c in categories if c.strip()]
-        
-        if categories:
-            for cat in categories:
-                st.markdown(f"### 📂 {cat}")
-                cat_items = library_links[library_links['category'].astype(str).fillna("") == cat]
-                
-                # 6列グリッドでリンクを表示（ファビコン＋6文字ラベル形式）
-                cols = st.columns(6)
-                for idx, (_, item) in enumerate(cat_items.iterrows()):
-                    with cols[idx % 6]:
-                        label = item.get('label', 'Link')
-                        url = item.get('url', '#')
-                        icon = item.get('icon', '🔗')
-                        
-                        # ファビコンURLを取得
-                        favicon_url = get_favicon_url(url)
-                        
-                        # ラベルを6文字に切り詰め
-                        truncated_label = truncate_label(label, 6)
-                        
-                        # ファビコン＋6文字ラベルの形式で表示
-                        if favicon_url:
-                            st.markdown(f"""
-                            <div style="text-align:center; margin-bottom:12px;">
-                                <a href="{url}" target="_blank" style="text-decoration:none; color:inherit;">
-                                    <div style="
-                                        width:64px; height:64px; margin:0 auto 8px;
-                                        background:rgba(40,40,45,0.8);
-                                        border-radius:50%;
-                                        display:flex; align-items:center; justify-content:center;
-                                        border:2px solid rgba(255,255,255,0.1);
-                                    ">
-                                        <div style="
-                                            width:48px; height:48px;
-                                            background:white;
-                                            border-radius:4px;
-                                            display:flex; align-items:center; justify-content:center;
-                                        ">
-                                            <img src="{favicon_url}" 
-                                                 style="width:40px; height:40px; object-fit:contain;" 
-                                                 onerror="this.style.display='none'; this.parentElement.innerHTML='{icon}';" />
-                                        </div>
-                                    </div>
-                                    <div style="
-                                        color:{COLORS['text_main']};
-                                        font-size:0.85em;
-                                        font-weight:500;
-                                        white-space: nowrap;
-                                        overflow: hidden;
-                                        text-overflow: ellipsis;
-                                    ">{truncated_label}</div>
-                                </a>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        else:
-                            # ファビコンが取得できない場合はアイコンを表示
-                            st.markdown(f"""
-                            <div style="text-align:center; margin-bottom:12px;">
-                                <a href="{url}" target="_blank" style="text-decoration:none; color:inherit;">
-                                    <div style="
-                                        width:64px; height:64px; margin:0 auto 8px;
-                                        background:rgba(40,40,45,0.8);
-                                        border-radius:50%;
-                                        display:flex; align-items:center; justify-content:center;
-                                        border:2px solid rgba(255,255,255,0.1);
-                                    ">
-                                        <div style="
-                                            width:48px; height:48px;
-                                            background:white;
-                                            border-radius:4px;
-                                            display:flex; align-items:center; justify-content:center;
-                                            font-size:24px;
-                                        ">{icon}</div>
-                                    </div>
-                                    <div style="
-                                        color:{COLORS['text_main']};
-                                        font-size:0.85em;
-                                        font-weight:500;
-                                        white-space: nowrap;
-                                        overflow: hidden;
-                                        text-overflow: ellipsis;
-                                    ">{truncated_label}</div>
-                                </a>
-                            </div>
-                            """, unsafe_allow_html=True)
-                st.markdown("---")
-        
-        # カテゴリが空欄のリンクを表示
-        no_cat_items = library_links[library_links['category'].astype(str).fillna("").str.strip() == ""]
-        if not no_cat_items.empty:
-            st.markdown("### 📌 その他")
-            cols = st.columns(6)
-            for idx, (_, item) in enumerate(no_cat_items.iterrows()):
-                with cols[idx % 6]:
-                    label = item.get('label', 'Link')
-                    url = item.get('url', '#')
-                    icon = item.get('icon', '🔗')
-                    
-                    # ファビコンURLを取得
-                    favicon_url = get_favicon_url(url)
-                    
-                    # ラベルを6文字に切り詰め
-                    truncated_label = truncate_label(label, 6)
-                    
-                    # ファビコン＋6文字ラベルの形式で表示
-                    if favicon_url:
-                        st.markdown(f"""
-                        <div style="text-align:center; margin-bottom:12px;">
-                            <a href="{url}" target="_blank" style="text-decoration:none; color:inherit;">
-                                <div style="
-                                    width:64px; height:64px; margin:0 auto 8px;
-                                    background:rgba(40,40,45,0.8);
-                                    border-radius:50%;
-                                    display:flex; align-items:center; justify-content:center;
-                                    border:2px solid rgba(255,255,255,0.1);
-                                ">
-                                    <div style="
-                                        width:48px; height:48px;
-                                        background:white;
-                                        border-radius:4px;
-                                        display:flex; align-items:center; justify-content:center;
-                                    ">
-                                        <img src="{favicon_url}" 
-                                             style="width:40px; height:40px; object-fit:contain;" 
-                                             onerror="this.style.display='none'; this.parentElement.innerHTML='{icon}';" />
-                                    </div>
-                                </div>
-                                <div style="
-                                    color:{COLORS['text_main']};
-                                    font-size:0.85em;
-                                    font-weight:500;
-                                    white-space: nowrap;
-                                    overflow: hidden;
-                                    text-overflow: ellipsis;
-                                ">{truncated_label}</div>
-                            </a>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        # ファビコンが取得できない場合はアイコンを表示
-                        st.markdown(f"""
-                        <div style="text-align:center; margin-bottom:12px;">
-                            <a href="{url}" target="_blank" style="text-decoration:none; color:inherit;">
-                                <div style="
-                                    width:64px; height:64px; margin:0 auto 8px;
-                                    background:rgba(40,40,45,0.8);
-                                    border-radius:50%;
-                                    display:flex; align-items:center; justify-content:center;
-                                    border:2px solid rgba(255,255,255,0.1);
-                                ">
-                                    <div style="
-                                        width:48px; height:48px;
-                                        background:white;
-                                        border-radius:4px;
-                                        display:flex; align-items:center; justify-content:center;
-                                        font-size:24px;
-                                    ">{icon}</div>
-                                </div>
-                                <div style="
-                                    color:{COLORS['text_main']};
-                                    font-size:0.85em;
-                                    font-weight:500;
-                                    white-space: nowrap;
-                                    overflow: hidden;
-                                    text-overflow: ellipsis;
-                                ">{truncated_label}</div>
-                            </a>
-                        </div>
-                        """, unsafe_allow_html=True)
+    hits = load_shortcut_catalog(manager).search(query, limit=5)
+    if not hits:
+        st.caption("該当するリンクがありません")
+        return
+    st.markdown("".join(
+        f'<a class="warp-gate-btn" href="{html.escape(item["url"], quote=True)}" target="_blank">'
+        f'{html.escape(str(item["icon"] or "🔗"))} {html.escape(item["label"])}</a>'
+        for item in hits
+    ), unsafe_allow_html=True)
 
 def render_warp_gate_trigger(manager):
     """サイドバー：ワープゲート起動ボタン"""
     st.sidebar.markdown("---")
+    render_global_search(manager)
+    render_link_launcher(manager)
     
     # 起動ボタン
     if st.sidebar.button("🌌 ワープゲートを開く", use_container_width=True, type="primary"):
@@ -1127,8 +3142,9 @@ def render_warp_gate_trigger(manager):
                     st.session_state['show_warpgate'] = False
                     st.rerun()
 
-def render_dashboard(manager):
-    """ダッシュボード (メイン画面)"""
+@fragment
+def render_idea_quick_add(manager):
+    """ダッシュボード: クイックアイデア追加（フラグメントとして単独で再実行）"""
     # --- クイックアイデア追加ボタン（ページ最上部） ---
     st.markdown("### 💡 クイックアイデア追加")
     col_idea_btn, col_idea_dummy = st.columns([3, 1])
@@ -1144,10 +3160,13 @@ def render_dashboard(manager):
 
                 submitted_idea = st.form_submit_button("このアイデアを保存する", use_container_width=True)
                 if submitted_idea:
-                    if idea_content:
+                    write_key = make_idempotency_key("idea_quick_add", idea_content)
+                    if manager.is_replay(write_key):
+                        st.info("同じ内容はすでに保存済みです。")
+                    elif idea_content:
                         new_idea_id = manager.get_next_id("ideas")
                         # カラム構成: id, content, created_at
-                        ok = manager.add_row("ideas", [new_idea_id, idea_content, get_now_jst()])
+                        ok = manager.add_row("ideas", [new_idea_id, idea_content, get_now_jst()], idempotency_key=write_key)
                         if ok:
                             # 活動履歴に記録
                             manager.add_activity_history(
@@ -1157,16 +3176,331 @@ def render_dashboard(manager):
                                 entity_name=idea_content[:50] + "..." if len(idea_content) > 50 else idea_content,
                                 old_value="",
                                 new_value=idea_content,
-                                details=""
+                                details="",
+                                idempotency_key=f"{write_key}:history"
                             )
                             add_log(f"新規アイデア追加: {idea_content[:20]}...")
                             st.success("アイデアを保存しました！")
                             st.session_state["show_idea_form"] = False
                             time.sleep(0.5)
-                            st.rerun()
+                            rerun_fragment()
                     else:
                         st.error("アイデア内容を入力してください。")
 
+def render_task_bulk_actions(manager, pending_tasks):
+    """ダッシュボード: 選択した複数タスクの完了・カテゴリ変更・削除をまとめて反映する
+    セルの更新は1回のbatch_update、履歴は1回のappend_rowsで書き込む"""
+    tasks_by_id = {str(task['id']): task for task in pending_tasks}
+
+    def task_label(task_id):
+        task = tasks_by_id[task_id]
+        return f"{CATEGORY_ICONS.get(task.get('category', 'その他'), '📌')} {task.get('title', 'No Title')}"
+
+    with st.form("task_bulk_form"):
+        selected = st.multiselect("対象のクエスト", list(tasks_by_id.keys()), format_func=task_label)
+        c_action, c_cat = st.columns([2, 1])
+        with c_action:
+            action = st.radio("操作", ["完了にする", "カテゴリを変更", "削除する"], horizontal=True)
+        with c_cat:
+            new_cat = st.selectbox("変更後のカテゴリ", list(CATEGORY_ICONS.keys()))
+        submitted = st.form_submit_button("選択したクエストに適用", use_container_width=True)
+
+    if not submitted:
+        return
+    if not selected:
+        st.error("クエストを選択してください")
+        return
+
+    targets = [tasks_by_id[task_id] for task_id in selected]
+    if action == "完了にする":
+        now_str = get_now_jst()
+        updated = {str(task_id) for task_id in manager.update_cells_by_ids("tasks", {
+            task['id']: {"status": "済", "completed_at": now_str} for task in targets
+        })}
+        count = len(updated)
+        # 履歴は実際に更新できたタスクの分だけ記録する
+        manager.add_activity_histories([{
+            "action_type": "タスク完了",
+            "entity_type": "tasks",
+            "entity_id": task['id'],
+            "entity_name": task.get('title', ''),
+            "old_value": "未",
+            "new_value": "済",
+            "details": f"カテゴリ: {task.get('category', 'その他')}" + (f", メモ: {task['memo']}" if task.get('memo') else "") + " | 一括操作",
+        } for task in targets if str(task['id']) in updated])
+        st.session_state.daily_exp = st.session_state.get('daily_exp', 0) + count
+        add_log(f"クエスト一括完了: {count}件")
+        if count:
+            # 達成数はフラグメント外のHUDに表示しているため、ページ全体を再実行する
+            st.rerun()
+    elif action == "カテゴリを変更":
+        targets = [task for task in targets if task.get('category') != new_cat]
+        updated = {str(task_id) for task_id in manager.update_cells_by_ids("tasks", {task['id']: {"category": new_cat} for task in targets})}
+        count = len(updated)
+        manager.add_activity_histories([{
+            "action_type": "タスク更新",
+            "entity_type": "tasks",
+            "entity_id": task['id'],
+            "entity_name": task.get('title', ''),
+            "old_value": task.get('category', ''),
+            "new_value": new_cat,
+            "details": "カテゴリ変更 | 一括操作",
+        } for task in targets if str(task['id']) in updated])
+        add_log(f"クエストのカテゴリを一括変更: {count}件 → {new_cat}")
+    else:
+        count = manager.delete_rows_by_ids("tasks", [task['id'] for task in targets], history=[{
+            "action_type": "タスク削除",
+            "entity_type": "tasks",
+            "entity_id": task['id'],
+            "entity_name": task.get('title', ''),
+            "old_value": task.get('status', '未'),
+            "new_value": "",
+            "details": f"カテゴリ: {task.get('category', 'その他')} | 一括操作",
+        } for task in targets])
+        add_log(f"クエスト一括削除: {count}件")
+    rerun_fragment()
+
+@fragment
+def render_task_list(manager):
+    """ダッシュボード: 未完了タスク一覧と新規タスク追加（フラグメントとして単独で再実行）"""
+    st.subheader("📝 進行中のクエスト (未完了タスク)")
+    st.caption("クリックで完了扱いにできます")
+
+    pending_tasks = manager.get_open_tasks()
+
+    if not pending_tasks:
+        st.balloons()
+        st.info("🎉 全てのクエストを完了しました！素晴らしい進捗です。")
+    elif st.checkbox("☑ まとめて操作", key="task_bulk_mode"):
+        render_task_bulk_actions(manager, pending_tasks)
+        return
+
+    for task in pending_tasks[:10]: # 表示数を制限
+        cat = task.get('category', 'その他')
+        icon = CATEGORY_ICONS.get(cat, "📌")
+
+        # ラベル作成
+        title = task.get('title', 'No Title')
+        memo = task.get('memo', '')
+
+        # 見やすい横並びラベル
+        label = f"⬜ {icon} {title}"
+        if memo:
+            label += f" : {memo}" # メモを横につなげる
+
+        # タスクボタン
+        write_key = make_idempotency_key("task_complete", task['id'])
+        if st.button(label, key=f"task_{task['id']}", use_container_width=True, help="完了にする") and not manager.is_replay(write_key):
+            now_str = get_now_jst()
+            if manager.update_cells_by_ids("tasks", {task['id']: {"status": "済", "completed_at": now_str}}, idempotency_key=write_key):
+                # 活動履歴に記録
+                manager.add_activity_history(
+                    action_type="タスク完了",
+                    entity_type="tasks",
+                    entity_id=task['id'],
+                    entity_name=title,
+                    old_value="未",
+                    new_value="済",
+                    details=f"カテゴリ: {cat}" + (f", メモ: {memo}" if memo else ""),
+                    idempotency_key=f"{write_key}:history"
+                )
+                st.session_state.daily_exp = st.session_state.get('daily_exp', 0) + 1
+                add_log(f"クエスト完了: {title}")
+                # 達成数はフラグメント外のHUDに表示しているため、ページ全体を再実行する
+                st.rerun()
+
+    # 新規タスク追加フォーム
+    # フォームリセット用のキーを管理
+    if 'task_form_key' not in st.session_state:
+        st.session_state.task_form_key = 0
+
+    with st.expander("➕ 新しいクエストを受注する", expanded=False):
+        with st.form(f"add_task_form_{st.session_state.task_form_key}"):
+            c_title, c_cat = st.columns([3, 1])
+            with c_title:
+                new_title = st.text_input("クエスト名 (必須)", key=f"task_title_{st.session_state.task_form_key}")
+            with c_cat:
+                new_cat = st.selectbox("カテゴリ", list(CATEGORY_ICONS.keys()), key=f"task_cat_{st.session_state.task_form_key}")
+
+            new_memo = st.text_area("メモ (任意)", height=3, key=f"task_memo_{st.session_state.task_form_key}")
+
+            add_and_complete = st.checkbox("追加と同時に完了にする", key=f"task_complete_{st.session_state.task_form_key}")
+
+            if st.form_submit_button("登録する", use_container_width=True):
+                write_key = make_idempotency_key("task_add", new_title, new_cat, new_memo, add_and_complete)
+                if manager.is_replay(write_key):
+                    st.info("同じクエストはすでに登録済みです。")
+                elif new_title:
+                    new_id = manager.get_next_id("tasks")
+                    now_str = get_now_jst()
+                    status_val = "済" if add_and_complete else "未"
+                    completed_at = now_str if add_and_complete else ""
+                    manager.add_row("tasks", [new_id, new_title, new_cat, status_val, new_memo, now_str, completed_at], idempotency_key=write_key)
+                    # 活動履歴に記録
+                    manager.add_activity_history(
+                        action_type="タスク追加",
+                        entity_type="tasks",
+                        entity_id=new_id,
+                        entity_name=new_title,
+                        old_value="",
+                        new_value=status_val,
+                        details=f"カテゴリ: {new_cat}" + (f", メモ: {new_memo}" if new_memo else "") + (" | 即完了" if add_and_complete else ""),
+                        idempotency_key=f"{write_key}:history"
+                    )
+                    add_log(f"新規クエスト追加: {new_title}" + (" (即完了)" if add_and_complete else ""))
+                    # フォームをリセットするためにキーを変更
+                    st.session_state.task_form_key += 1
+                    st.success("登録しました")
+                    time.sleep(0.5)
+                    rerun_fragment()
+                else:
+                    st.error("クエスト名を入力してください")
+
+@fragment
+def render_project_cards(manager):
+    """ダッシュボード: プロジェクト戦況カード（フラグメントとして単独で再実行）"""
+    st.subheader("📊 プロジェクト戦況")
+
+    projects = manager.get_records("projects")
+    # 進行中のものを優先表示（完了プロジェクトは非表示）
+    active_projects = [p for p in projects if p.get('status') == '進行中']
+    other_projects = [p for p in projects if p.get('status') != '進行中' and p.get('status') != '完了']
+
+    display_list = active_projects + other_projects
+
+    for proj in display_list[:5]: # 最大5件表示
+        status = proj.get('status', '進行中')
+        theme = proj.get('theme', 'No Theme')
+        current_memo = proj.get('memo', '')
+
+        # ステータス色分け
+        color = COLORS['accent_blue']
+        if status == '完了': color = COLORS['accent_green']
+        elif status == '保留': color = COLORS['text_dim']
+        elif status == '進行中': color = COLORS['accent_cyan']
+
+        # リンクHTML生成
+        links_html = extract_urls_as_html(proj.get('links', ''))
+
+        # メモ編集用のキー
+        edit_memo_key = f"dashboard_edit_memo_{proj['id']}"
+        is_editing_memo = st.session_state.get(edit_memo_key, False)
+
+        if is_editing_memo:
+            # 編集モード - カード全体を再構築
+            st.markdown(f"""
+            <div style="
+                margin-bottom:12px; 
+                padding:12px; 
+                border:1px solid {color}44; 
+                border-left: 3px solid {color};
+                border-radius:4px;
+                background: rgba(20,20,20,0.4);
+            ">
+                <div style="display:flex; justify-content:space-between; align-items:center;">
+                    <span style="font-weight:bold; color:{COLORS['text_main']}">{theme}</span>
+                    <span style="
+                        font-size:0.7em; 
+                        color:{color}; 
+                        border:1px solid {color}; 
+                        padding:1px 6px; 
+                        border-radius:10px;
+                    ">{status}</span>
+                </div>
+                <div style="margin-top:8px;">{links_html}</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+            # 編集フォームを表示
+            with st.form(f"dashboard_memo_edit_{proj['id']}"):
+                new_memo = st.text_area("💬 メモ", value=current_memo, height=4, key=f"dashboard_memo_{proj['id']}")
+                col_save, col_cancel = st.columns([1, 1])
+                with col_save:
+                    if st.form_submit_button("保存", use_container_width=True, type="primary"):
+                        if new_memo != current_memo:
+                            old_memo = current_memo
+                            now_str = get_now_jst()
+                            manager.update_cell_by_id("projects", proj['id'], "memo", new_memo)
+                            manager.update_cell_by_id("projects", proj['id'], "memo_updated_at", now_str)
+                            # 活動履歴に記録
+                            manager.add_activity_history(
+                                action_type="プロジェクトコメント更新",
+                                entity_type="projects",
+                                entity_id=proj['id'],
+                                entity_name=theme,
+                                old_value=old_memo,
+                                new_value=new_memo,
+                                details=""
+                            )
+                            # 後方互換性のため、project_comments_historyにも記録
+                            manager.add_comment_history(proj['id'], theme, new_memo, now_str)
+                            add_log(f"プロジェクトメモ更新(ダッシュボード): {theme}")
+                            st.success("メモを更新しました")
+                            st.session_state[edit_memo_key] = False
+                            time.sleep(0.3)
+                            rerun_fragment()
+                        else:
+                            st.session_state[edit_memo_key] = False
+                            rerun_fragment()
+                with col_cancel:
+                    if st.form_submit_button("キャンセル", use_container_width=True):
+                        st.session_state[edit_memo_key] = False
+                        rerun_fragment()
+        else:
+            # 通常表示モード - メモを含む完全なカードを表示
+            # メモ表示用HTML
+            if current_memo:
+                memo_lines = current_memo.replace('\n', '<br>')
+                memo_html = f'<div style="margin-top:8px; padding:8px; background:rgba(0,0,0,0.2); border-radius:4px; color:{COLORS["text_dim"]}; font-size:0.9em; white-space:pre-wrap;">💬 {memo_lines}</div>'
+            else:
+                memo_html = '<div style="margin-top:8px; padding:8px; background:rgba(0,0,0,0.1); border-radius:4px; color:rgba(160,160,160,0.5); font-size:0.85em; font-style:italic;">💬 メモがありません</div>'
+
+            # HTMLカード描画（メモを含む、完全に閉じる）
+            st.markdown(f"""
+            <div style="
+                margin-bottom:12px; 
+                padding:12px; 
+                border:1px solid {color}44; 
+                border-left: 3px solid {color};
+                border-radius:4px;
+                background: rgba(20,20,20,0.4);
+            ">
+                <div style="display:flex; justify-content:space-between; align-items:center;">
+                    <span style="font-weight:bold; color:{COLORS['text_main']}">{theme}</span>
+                    <span style="
+                        font-size:0.7em; 
+                        color:{color}; 
+                        border:1px solid {color}; 
+                        padding:1px 6px; 
+                        border-radius:10px;
+                    ">{status}</span>
+                </div>
+                <div style="margin-top:8px;">{links_html}</div>
+                {memo_html}
+            </div>
+            """, unsafe_allow_html=True)
+
+            # 編集ボタン（カードの下に配置）
+            if st.button("✏️ メモを編集", key=f"dashboard_edit_btn_{proj['id']}", use_container_width=True):
+                st.session_state[edit_memo_key] = True
+                rerun_fragment()
+
+@fragment
+def render_system_log():
+    """ダッシュボード: システムログ（フラグメントとして単独で再実行）"""
+    with st.expander("🖥 システムログ", expanded=False):
+        if st.button("🔄 ログを更新", key="refresh_system_log"):
+            rerun_fragment()
+        logs = st.session_state.get('system_log', [])
+        log_text = "<br>".join([f"<span style='color:{COLORS['accent_cyan']}'>{l}</span>" for l in reversed(logs)])
+        st.markdown(f"<div style='font-family:monospace; font-size:0.8em;'>{log_text}</div>", unsafe_allow_html=True)
+
+def render_dashboard(manager):
+    """ダッシュボード (メイン画面)
+    タスク一覧・プロジェクトカード・アイデアフォーム・システムログはフラグメントとして
+    それぞれ単独で再実行される（全体の再実行はページ遷移時と、HUDの達成数が変わるタスク完了時のみ）"""
+    render_idea_quick_add(manager)
+
     # --- クイック・ランチパッド (ヘッダー直下) ---
     render_quick_launchpad(manager)
     
@@ -1180,11 +3514,7 @@ def render_dashboard(manager):
         daily_exp = st.session_state.get('daily_exp', 0)
         st.metric("本日のクエスト達成数", f"{daily_exp}", delta="Keep going!")
     with c3:
-        settings = manager.get_records("settings")
-        last_report = "未記録"
-        for s in settings:
-            if s.get('key') == 'last_report_at':
-                last_report = s.get('value')
+        last_report = manager.settings.get_str("last_report_at", "未記録")
         # 日時を短縮表示 (MM-DD HH:MM)
         disp_time = last_report[5:16] if len(last_report) > 10 else last_report
         st.metric("最終レポート出力", disp_time)
@@ -1195,230 +3525,151 @@ def render_dashboard(manager):
 
     # === 左カラム: タスク管理 ===
     with col_left:
-        st.subheader("📝 進行中のクエスト (未完了タスク)")
-        st.caption("クリックで完了扱いにできます")
-        
-        tasks = manager.get_records("tasks")
-        pending_tasks = [t for t in tasks if t.get('status') == '未']
-        
-        if not pending_tasks:
-            st.balloons()
-            st.info("🎉 全てのクエストを完了しました！素晴らしい進捗です。")
-        
-        for task in pending_tasks[:10]: # 表示数を制限
-            cat = task.get('category', 'その他')
-            icon = CATEGORY_ICONS.get(cat, "📌")
-            
-            # ラベル作成
-            title = task.get('title', 'No Title')
-            memo = task.get('memo', '')
-            
-            # 見やすい横並びラベル
-            label = f"⬜ {icon} {title}"
-            if memo:
-                label += f" : {memo}" # メモを横につなげる
-            
-            # タスクボタン
-            if st.button(label, key=f"task_{task['id']}", use_container_width=True, help="完了にする"):
-                now_str = get_now_jst()
-                manager.update_cell_by_id("tasks", task['id'], "status", "済")
-                manager.update_cell_by_id("tasks", task['id'], "completed_at", now_str)
-                # 活動履歴に記録
-                manager.add_activity_history(
-                    action_type="タスク完了",
-                    entity_type="tasks",
-                    entity_id=task['id'],
-                    entity_name=title,
-                    old_value="未",
-                    new_value="済",
-                    details=f"カテゴリ: {cat}" + (f", メモ: {memo}" if memo else "")
-                )
-                st.session_state.daily_exp = st.session_state.get('daily_exp', 0) + 1
-                add_log(f"クエスト完了: {title}")
-                st.rerun()
-
-        # 新規タスク追加フォーム
-        # フォームリセット用のキーを管理
-        if 'task_form_key' not in st.session_state:
-            st.session_state.task_form_key = 0
-        
-        with st.expander("➕ 新しいクエストを受注する", expanded=False):
-            with st.form(f"add_task_form_{st.session_state.task_form_key}"):
-                c_title, c_cat = st.columns([3, 1])
-                with c_title:
-                    new_title = st.text_input("クエスト名 (必須)", key=f"task_title_{st.session_state.task_form_key}")
-                with c_cat:
-                    new_cat = st.selectbox("カテゴリ", list(CATEGORY_ICONS.keys()), key=f"task_cat_{st.session_state.task_form_key}")
-                
-                new_memo = st.text_area("メモ (任意)", height=3, key=f"task_memo_{st.session_state.task_form_key}")
-                
-                add_and_complete = st.checkbox("追加と同時に完了にする", key=f"task_complete_{st.session_state.task_form_key}")
-                
-                if st.form_submit_button("登録する", use_container_width=True):
-                    if new_title:
-                        new_id = manager.get_next_id("tasks")
-                        now_str = get_now_jst()
-                        status_val = "済" if add_and_complete else "未"
-                        completed_at = now_str if add_and_complete else ""
-                        manager.add_row("tasks", [new_id, new_title, new_cat, status_val, new_memo, now_str, completed_at])
-                        # 活動履歴に記録
-                        manager.add_activity_history(
-                            action_type="タスク追加",
-                            entity_type="tasks",
-                            entity_id=new_id,
-                            entity_name=new_title,
-                            old_value="",
-                            new_value=status_val,
-                            details=f"カテゴリ: {new_cat}" + (f", メモ: {new_memo}" if new_memo else "") + (" | 即完了" if add_and_complete else "")
-                        )
-                        add_log(f"新規クエスト追加: {new_title}" + (" (即完了)" if add_and_complete else ""))
-                        # フォームをリセットするためにキーを変更
-                        st.session_state.task_form_key += 1
-                        st.success("登録しました")
-                        time.sleep(0.5)
-                        st.rerun()
-                    else:
-                        st.error("クエスト名を入力してください")
+        render_task_list(manager)
 
     # === 右カラム: プロジェクト状況 ===
     with col_right:
-        st.subheader("📊 プロジェクト戦況")
-        
-        projects = manager.get_records("projects")
-        # 進行中のものを優先表示（完了プロジェクトは非表示）
-        active_projects = [p for p in projects if p.get('status') == '進行中']
-        other_projects = [p for p in projects if p.get('status') != '進行中' and p.get('status') != '完了']
-        
-        display_list = active_projects + other_projects
-        
-        for proj in display_list[:5]: # 最大5件表示
-            status = proj.get('status', '進行中')
-            theme = proj.get('theme', 'No Theme')
-            current_memo = proj.get('memo', '')
-            
-            # ステータス色分け
-            color = COLORS['accent_blue']
-            if status == '完了': color = COLORS['accent_green']
-            elif status == '保留': color = COLORS['text_dim']
-            elif status == '進行中': color = COLORS['accent_cyan']
-
-            # リンクHTML生成
-            links_html = extract_urls_as_html(proj.get('links', ''))
-            
-            # メモ編集用のキー
-            edit_memo_key = f"dashboard_edit_memo_{proj['id']}"
-            is_editing_memo = st.session_state.get(edit_memo_key, False)
-            
-            if is_editing_memo:
-                # 編集モード - カード全体を再構築
-                st.markdown(f"""
-                <div style="
-                    margin-bottom:12px; 
-                    padding:12px; 
-                    border:1px solid {color}44; 
-                    border-left: 3px solid {color};
-                    border-radius:4px;
-                    background: rgba(20,20,20,0.4);
-                ">
-                    <div style="display:flex; justify-content:space-between; align-items:center;">
-                        <span style="font-weight:bold; color:{COLORS['text_main']}">{theme}</span>
-                        <span style="
-                            font-size:0.7em; 
-                            color:{color}; 
-                            border:1px solid {color}; 
-                            padding:1px 6px; 
-                            border-radius:10px;
-                        ">{status}</span>
-                    </div>
-                    <div style="margin-top:8px;">{links_html}</div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # 編集フォームを表示
-                with st.form(f"dashboard_memo_edit_{proj['id']}"):
-                    new_memo = st.text_area("💬 メモ", value=current_memo, height=4, key=f"dashboard_memo_{proj['id']}")
-                    col_save, col_cancel = st.columns([1, 1])
-                    with col_save:
-                        if st.form_submit_button("保存", use_container_width=True, type="primary"):
-                            if new_memo != current_memo:
-                                old_memo = current_memo
-                                now_str = get_now_jst()
-                                manager.update_cell_by_id("projects", proj['id'], "memo", new_memo)
-                                manager.update_cell_by_id("projects", proj['id'], "memo_updated_at", now_str)
-                                # 活動履歴に記録
-                                manager.add_activity_history(
-                                    action_type="プロジェクトコメント更新",
-                                    entity_type="projects",
-                                    entity_id=proj['id'],
-                                    entity_name=theme,
-                                    old_value=old_memo,
-                                    new_value=new_memo,
-                                    details=""
-                                )
-                                # 後方互換性のため、project_comments_historyにも記録
-                                manager.add_comment_history(proj['id'], theme, new_memo, now_str)
-                                add_log(f"プロジェクトメモ更新(ダッシュボード): {theme}")
-                                st.success("メモを更新しました")
-                                st.session_state[edit_memo_key] = False
-                                time.sleep(0.3)
-                                st.rerun()
-                            else:
-                                st.session_state[edit_memo_key] = False
-                                st.rerun()
-                    with col_cancel:
-                        if st.form_submit_button("キャンセル", use_container_width=True):
-                            st.session_state[edit_memo_key] = False
-                            st.rerun()
-            else:
-                # 通常表示モード - メモを含む完全なカードを表示
-                # メモ表示用HTML
-                if current_memo:
-                    memo_lines = current_memo.replace('\n', '<br>')
-                    memo_html = f'<div style="margin-top:8px; padding:8px; background:rgba(0,0,0,0.2); border-radius:4px; color:{COLORS["text_dim"]}; font-size:0.9em; white-space:pre-wrap;">💬 {memo_lines}</div>'
-                else:
-                    memo_html = '<div style="margin-top:8px; padding:8px; background:rgba(0,0,0,0.1); border-radius:4px; color:rgba(160,160,160,0.5); font-size:0.85em; font-style:italic;">💬 メモがありません</div>'
-                
-                # HTMLカード描画（メモを含む、完全に閉じる）
-                st.markdown(f"""
-                <div style="
-                    margin-bottom:12px; 
-                    padding:12px; 
-                    border:1px solid {color}44; 
-                    border-left: 3px solid {color};
-                    border-radius:4px;
-                    background: rgba(20,20,20,0.4);
-                ">
-                    <div style="display:flex; justify-content:space-between; align-items:center;">
-                        <span style="font-weight:bold; color:{COLORS['text_main']}">{theme}</span>
-                        <span style="
-                            font-size:0.7em; 
-                            color:{color}; 
-                            border:1px solid {color}; 
-                            padding:1px 6px; 
-                            border-radius:10px;
-                        ">{status}</span>
-                    </div>
-                    <div style="margin-top:8px;">{links_html}</div>
-                    {memo_html}
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # 編集ボタン（カードの下に配置）
-                if st.button("✏️ メモを編集", key=f"dashboard_edit_btn_{proj['id']}", use_container_width=True):
-                    st.session_state[edit_memo_key] = True
-                    st.rerun()
-            
+        render_project_cards(manager)
+
         if st.button("プロジェクト一覧へ移動", use_container_width=True):
             st.session_state['current_page'] = "CAMPAIGN"
             st.rerun()
 
     # --- システムログ ---
     st.markdown("---")
-    with st.expander("🖥 システムログ", expanded=False):
-        logs = st.session_state.get('system_log', [])
-        log_text = "<br>".join([f"<span style='color:{COLORS['accent_cyan']}'>{l}</span>" for l in reversed(logs)])
-        st.markdown(f"<div style='font-family:monospace; font-size:0.8em;'>{log_text}</div>", unsafe_allow_html=True)
+    render_system_log()
+
+
+def render_project_editor(manager, proj):
+    """プロジェクト1件分の編集UI（一覧で開かれたプロジェクトに対してだけ構築する）"""
+    status = proj.get('status', '進行中')
+    c_edit, c_view = st.columns([1, 1])
+
+    # 編集エリア
+    with c_edit:
+        st.caption("🛠 設定変更")
+        new_theme = st.text_input("テーマ名", value=proj.get('theme'), key=f"th_{proj['id']}")
+        new_status = st.selectbox("状態", ["進行中", "完了", "保留"], 
+                                index=["進行中", "完了", "保留"].index(status) if status in ["進行中", "完了", "保留"] else 0,
+                                key=f"st_{proj['id']}")
+
+        if st.button("更新を保存", key=f"upd_{proj['id']}"):
+            old_theme = proj.get('theme', '')
+            old_status = proj.get('status', '')
+            now_str = get_now_jst()
+
+            # テーマが変更された場合
+            if new_theme != old_theme:
+                manager.update_cell_by_id("projects", proj['id'], "theme", new_theme)
+                manager.add_activity_history(
+                    action_type="プロジェクトテーマ更新",
+                    entity_type="projects",
+                    entity_id=proj['id'],
+                    entity_name=new_theme,
+                    old_value=old_theme,
+                    new_value=new_theme,
+                    details=""
+                )
+
+            # ステータスが変更された場合
+            if new_status != old_status:
+                manager.update_cell_by_id("projects", proj['id'], "status", new_status)
+                manager.add_activity_history(
+                    action_type="プロジェクトステータス更新",
+                    entity_type="projects",
+                    entity_id=proj['id'],
+                    entity_name=new_theme if new_theme != old_theme else old_theme,
+                    old_value=old_status,
+                    new_value=new_status,
+                    details=""
+                )
+
+            manager.update_cell_by_id("projects", proj['id'], "updated_at", now_str)
+            st.success("更新しました！")
+            time.sleep(0.5)
+            st.rerun()
+
+    # 詳細エリア
+    with c_view:
+        st.caption("📝 詳細情報")
+        # リンク編集とメモ編集
+        st.markdown("**関連リンク**")
+
+        # リンクデータの初期化
+        links_key = f"project_links_{proj['id']}"
+        if links_key not in st.session_state:
+            # 既存のリンクをパース
+            existing_links = parse_links(proj.get('links', ''))
+            if not existing_links:
+                existing_links = [("", "")]
+            st.session_state[links_key] = existing_links
+
+        # リンク入力項目
+        links_to_remove = []
+        for idx, (label, url) in enumerate(st.session_state[links_key]):
+            col1, col2, col3 = st.columns([3, 3, 1])
+            with col1:
+                new_label = st.text_input("ラベル", value=label, key=f"link_label_{proj['id']}_{idx}", placeholder="例: Note記事")
+            with col2:
+                new_url = st.text_input("URL", value=url, key=f"link_url_{proj['id']}_{idx}", placeholder="https://example.com")
+            with col3:
+                if st.button("削除", key=f"link_del_{proj['id']}_{idx}"):
+                    links_to_remove.append(idx)
+
+            # 値を更新
+            if idx < len(st.session_state[links_key]):
+                st.session_state[links_key][idx] = (new_label, new_url)
+
+        # 削除処理
+        for idx in sorted(links_to_remove, reverse=True):
+            if idx < len(st.session_state[links_key]):
+                st.session_state[links_key].pop(idx)
+                st.rerun()
+
+        # リンク追加ボタン
+        if st.button("➕ リンクを追加", key=f"link_add_{proj['id']}"):
+            st.session_state[links_key].append(("", ""))
+            st.rerun()
+
+        # リンク索引から、同じURLを参照しているプロジェクトと登録済みショートカットを表示
+        link_index = get_link_index(manager)
+        related = link_index.related_projects(proj['id'])
+        if related:
+            st.caption("🔗 同じリンクを参照: " + " / ".join(theme for _, theme in related))
+        registered = [label for label in (link_index.shortcut_label(url) for _, url in parse_links(proj.get('links', ''))) if label]
+        if registered:
+            st.caption("🌌 ワープゲート登録済み: " + " / ".join(registered))
 
+        new_memo = st.text_area("メモ", value=proj.get('memo', ''), height=80, key=f"mm_{proj['id']}")
+
+        # ここだけ個別保存ボタン（誤操作防止のため）
+        if st.button("詳細を保存", key=f"det_{proj['id']}"):
+            old_memo = proj.get('memo', '')
+            # リンクをフォーマットして保存
+            formatted_links = format_links(st.session_state[links_key])
+            manager.update_cell_by_id("projects", proj['id'], "links", formatted_links)
+            manager.update_cell_by_id("projects", proj['id'], "memo", new_memo)
+            # メモが変更された場合、memo_updated_atを更新し、履歴に記録
+            if new_memo != old_memo:
+                now_str = get_now_jst()
+                manager.update_cell_by_id("projects", proj['id'], "memo_updated_at", now_str)
+                # 活動履歴に記録
+                theme = proj.get('theme', '')
+                manager.add_activity_history(
+                    action_type="プロジェクトコメント更新",
+                    entity_type="projects",
+                    entity_id=proj['id'],
+                    entity_name=theme,
+                    old_value=old_memo,
+                    new_value=new_memo,
+                    details=""
+                )
+                # 後方互換性のため、project_comments_historyにも記録（activity_historyには記録しない）
+                manager.add_comment_history(proj['id'], theme, new_memo, now_str)
+                add_log(f"プロジェクトコメント履歴記録: {theme}")
+            st.success("詳細を保存しました")
+            time.sleep(0.5)
+            st.rerun()
 
 def render_project_manager(manager):
     """プロジェクト管理画面"""
@@ -1441,130 +3692,40 @@ def render_project_manager(manager):
         st.info("表示するプロジェクトがありません。")
         return
         
-    # アコーディオンで一覧表示（デフォルトはすべて閉じる）
-    for proj in projects:
+    # 一覧は軽量なサマリー行のみ表示し、編集UIは開いたプロジェクトだけ構築する
+    open_ids = st.session_state.setdefault('open_project_ids', set())
+    # 全体検索から開かれたプロジェクトがあれば、そのページへ移動
+    focus_id = st.session_state.pop('focus_project_id', None)
+    if focus_id is not None:
+        for position, proj in enumerate(projects):
+            if str(proj['id']) == focus_id:
+                st.session_state['project_page'] = position // PROJECT_PAGE_SIZE
+                break
+    start, end = render_pager(len(projects), "project_page", PROJECT_PAGE_SIZE)
+    for proj in projects[start:end]:
         status = proj.get('status', '進行中')
         icon = "🔹" if status == '進行中' else "✅" if status == '完了' else "💤"
-        
-        with st.expander(f"{icon} {proj.get('theme')}", expanded=False):
-            c_edit, c_view = st.columns([1, 1])
-            
-            # 編集エリア
-            with c_edit:
-                st.caption("🛠 設定変更")
-                new_theme = st.text_input("テーマ名", value=proj.get('theme'), key=f"th_{proj['id']}")
-                new_status = st.selectbox("状態", ["進行中", "完了", "保留"], 
-                                        index=["進行中", "完了", "保留"].index(status) if status in ["進行中", "完了", "保留"] else 0,
-                                        key=f"st_{proj['id']}")
-                
-                if st.button("更新を保存", key=f"upd_{proj['id']}"):
-                    old_theme = proj.get('theme', '')
-                    old_status = proj.get('status', '')
-                    now_str = get_now_jst()
-                    
-                    # テーマが変更された場合
-                    if new_theme != old_theme:
-                        manager.update_cell_by_id("projects", proj['id'], "theme", new_theme)
-                        manager.add_activity_history(
-                            action_type="プロジェクトテーマ更新",
-                            entity_type="projects",
-                            entity_id=proj['id'],
-                            entity_name=new_theme,
-                            old_value=old_theme,
-                            new_value=new_theme,
-                            details=""
-                        )
-                    
-                    # ステータスが変更された場合
-                    if new_status != old_status:
-                        manager.update_cell_by_id("projects", proj['id'], "status", new_status)
-                        manager.add_activity_history(
-                            action_type="プロジェクトステータス更新",
-                            entity_type="projects",
-                            entity_id=proj['id'],
-                            entity_name=new_theme if new_theme != old_theme else old_theme,
-                            old_value=old_status,
-                            new_value=new_status,
-                            details=""
-                        )
-                    
-                    manager.update_cell_by_id("projects", proj['id'], "updated_at", now_str)
-                    st.success("更新しました！")
-                    time.sleep(0.5)
-                    st.rerun()
+        proj_id = str(proj['id'])
+        is_open = proj_id in open_ids
 
-            # 詳細エリア
-            with c_view:
-                st.caption("📝 詳細情報")
-                # リンク編集とメモ編集
-                st.markdown("**関連リンク**")
-                
-                # リンクデータの初期化
-                links_key = f"project_links_{proj['id']}"
-                if links_key not in st.session_state:
-                    # 既存のリンクをパース
-                    existing_links = parse_links(proj.get('links', ''))
-                    if not existing_links:
-                        existing_links = [("", "")]
-                    st.session_state[links_key] = existing_links
-                
-                # リンク入力項目
-                links_to_remove = []
-                for idx, (label, url) in enumerate(st.session_state[links_key]):
-                    col1, col2, col3 = st.columns([3, 3, 1])
-                    with col1:
-                        new_label = st.text_input("ラベル", value=label, key=f"link_label_{proj['id']}_{idx}", placeholder="例: Note記事")
-                    with col2:
-                        new_url = st.text_input("URL", value=url, key=f"link_url_{proj['id']}_{idx}", placeholder="https://example.com")
-                    with col3:
-                        if st.button("削除", key=f"link_del_{proj['id']}_{idx}"):
-                            links_to_remove.append(idx)
-                    
-                    # 値を更新
-                    if idx < len(st.session_state[links_key]):
-                        st.session_state[links_key][idx] = (new_label, new_url)
-                
-                # 削除処理
-                for idx in sorted(links_to_remove, reverse=True):
-                    if idx < len(st.session_state[links_key]):
-                        st.session_state[links_key].pop(idx)
-                        st.rerun()
-                
-                # リンク追加ボタン
-                if st.button("➕ リンクを追加", key=f"link_add_{proj['id']}"):
-                    st.session_state[links_key].append(("", ""))
-                    st.rerun()
-                
-                new_memo = st.text_area("メモ", value=proj.get('memo', ''), height=80, key=f"mm_{proj['id']}")
-                
-                # ここだけ個別保存ボタン（誤操作防止のため）
-                if st.button("詳細を保存", key=f"det_{proj['id']}"):
-                    old_memo = proj.get('memo', '')
-                    # リンクをフォーマットして保存
-                    formatted_links = format_links(st.session_state[links_key])
-                    manager.update_cell_by_id("projects", proj['id'], "links", formatted_links)
-                    manager.update_cell_by_id("projects", proj['id'], "memo", new_memo)
-                    # メモが変更された場合、memo_updated_atを更新し、履歴に記録
-                    if new_memo != old_memo:
-                        now_str = get_now_jst()
-                        manager.update_cell_by_id("projects", proj['id'], "memo_updated_at", now_str)
-                        # 活動履歴に記録
-                        theme = proj.get('theme', '')
-                        manager.add_activity_history(
-                            action_type="プロジェクトコメント更新",
-                            entity_type="projects",
-                            entity_id=proj['id'],
-                            entity_name=theme,
-                            old_value=old_memo,
-                            new_value=new_memo,
-                            details=""
-                        )
-                        # 後方互換性のため、project_comments_historyにも記録（activity_historyには記録しない）
-                        manager.add_comment_history(proj['id'], theme, new_memo, now_str)
-                        add_log(f"プロジェクトコメント履歴記録: {theme}")
-                    st.success("詳細を保存しました")
-                    time.sleep(0.5)
-                    st.rerun()
+        c_title, c_meta, c_toggle = st.columns([5, 2, 1])
+        with c_title:
+            st.markdown(f"**{icon} {proj.get('theme')}**")
+        with c_meta:
+            updated_at = proj.get('updated_at', '')
+            st.caption(f"{status}" + (f" | 更新: {updated_at}" if updated_at else ""))
+        with c_toggle:
+            if st.button("閉じる" if is_open else "開く", key=f"proj_toggle_{proj_id}", use_container_width=True):
+                if is_open:
+                    open_ids.discard(proj_id)
+                else:
+                    open_ids.add(proj_id)
+                st.rerun()
+
+        if is_open:
+            with st.container():
+                render_project_editor(manager, proj)
+            st.markdown("---")
 
     st.markdown("---")
     with st.expander("➕ 新規プロジェクト立ち上げ", expanded=False):
@@ -1610,15 +3771,18 @@ def render_project_manager(manager):
         f_memo = st.text_area("メモ", key="new_proj_memo")
         
         if st.button("作成する", type="primary", use_container_width=True, key="new_proj_submit"):
-            if f_theme:
+            # リンクをフォーマットして保存
+            f_links = format_links(st.session_state.new_project_links)
+            write_key = make_idempotency_key("project_create", f_theme, f_links, f_memo)
+            if manager.is_replay(write_key):
+                st.info(f"プロジェクト「{f_theme}」はすでに作成済みです")
+            elif f_theme:
                 new_id = manager.get_next_id("projects")
                 now_str = get_now_jst()
-                # リンクをフォーマットして保存
-                f_links = format_links(st.session_state.new_project_links)
                 # id, theme, status, links, memo, updated_at, memo_updated_at
                 # メモが入力されている場合、memo_updated_atも設定し、履歴に記録
                 memo_updated_at = now_str if f_memo.strip() else ""
-                manager.add_row("projects", [new_id, f_theme, "進行中", f_links, f_memo, now_str, memo_updated_at])
+                manager.add_row("projects", [new_id, f_theme, "進行中", f_links, f_memo, now_str, memo_updated_at], idempotency_key=write_key)
                 # リンクデータをリセット
                 st.session_state.new_project_links = [("", "")]
                 # 活動履歴に記録
@@ -1629,7 +3793,8 @@ def render_project_manager(manager):
                     entity_name=f_theme,
                     old_value="",
                     new_value="進行中",
-                    details=f"メモ: {f_memo}" if f_memo.strip() else ""
+                    details=f"メモ: {f_memo}" if f_memo.strip() else "",
+                    idempotency_key=f"{write_key}:history"
                 )
                 # メモが入力されている場合、コメント履歴にも記録
                 if f_memo.strip():
@@ -1648,21 +3813,12 @@ def render_report_generator(manager):
     st.caption("前回の出力以降の差分（完了タスク・プロジェクト更新）を自動抽出します")
     
     # Settings取得
-    settings = manager.get_records("settings")
-    last_report_at = "2000-01-01 00:00:00"
-    for s in settings:
-        if s.get('key') == 'last_report_at':
-            last_report_at = s.get('value')
-            
+    last_report_at = manager.settings.get_str("last_report_at", "2000-01-01 00:00:00")
+
     st.info(f"🕒 前回のセーブ日時: **{last_report_at}**")
     
-    # 活動履歴シートからすべての履歴を取得
-    activity_history = manager.get_records("activity_history")
-    
     # 日時をdatetimeオブジェクトに変換して比較
     try:
-        from datetime import datetime
-        import pytz
         # last_report_atをdatetimeオブジェクトに変換
         if last_report_at and last_report_at != "2000-01-01 00:00:00":
             try:
@@ -1676,6 +3832,9 @@ def render_report_generator(manager):
         st.warning(f"日時変換エラー: {e}")
         last_report_dt = datetime.strptime("2000-01-01 00:00:00", '%Y-%m-%d %H:%M:%S')
     
+    # 活動履歴を取得（前回出力がアーカイブ境界より古い場合はアーカイブも参照される）
+    activity_history = manager.get_activity_history(since=last_report_dt)
+    
     # 日時を比較してフィルタリング
     recent_activities = []
     for a in activity_history:
@@ -1704,11 +3863,14 @@ def render_report_generator(manager):
         action_icons = {
             "タスク追加": "➕",
             "タスク完了": "✅",
+            "タスク更新": "🏷️",
+            "タスク削除": "🗑️",
             "プロジェクト作成": "🆕",
             "プロジェクトステータス更新": "🔄",
             "プロジェクトテーマ更新": "✏️",
             "プロジェクトコメント更新": "💬",
-            "アイデア追加": "💡"
+            "アイデア追加": "💡",
+            "アイデア削除": "🗑️"
         }
         
         for activity in recent_activities:
@@ -1761,24 +3923,234 @@ def render_report_generator(manager):
         st.write("内容を確認したら、以下のボタンで日時を更新（セーブ）してください。")
         
         if st.button("レポート完了としてセーブ (日時更新)", type="primary", use_container_width=True):
-            # Settings更新
-            settings_sheet = manager.spreadsheet.worksheet("settings")
-            cell = settings_sheet.find("last_report_at")
+            # Settings更新（記憶している行のセルへ直接書き込む）
             now_str = get_now_jst()
-            
-            if cell:
-                settings_sheet.update_cell(cell.row, cell.col + 1, now_str)
-            else:
-                settings_sheet.append_row(["last_report_at", now_str])
-                
-            manager.clear_cache()
-            st.success(f"✅ セーブ完了！ 基準日時を {now_str} に更新しました。")
-            st.balloons()
+            if manager.settings.set("last_report_at", now_str):
+                st.success(f"✅ セーブ完了！ 基準日時を {now_str} に更新しました。")
+                st.balloons()
             
         st.markdown("---")
         st.caption("※ Noteやブログに貼り付ける場合は、左のテキストをコピーしてください。")
 
 
+def render_analytics(manager):
+    """スループット分析画面"""
+    st.title("📈 スループット分析")
+    st.caption("完了タスク・アイデア追加・プロジェクト活動の推移を確認できます")
+
+    period_options = {"直近30日": 30, "直近90日": 90, "直近1年": 365}
+    period_label = st.radio("集計期間", list(period_options.keys()), horizontal=True, key="analytics_period")
+    days = period_options[period_label]
+
+    frames = build_throughput_frames(manager, manager.data_version, days, get_now_jst()[:10])
+    tasks_per_day = frames["tasks_per_day"]
+    ideas_per_week = frames["ideas_per_week"]
+    project_heatmap = frames["project_heatmap"]
+
+    m1, m2, m3 = st.columns(3)
+    with m1:
+        st.metric("完了タスク", int(tasks_per_day["完了タスク"].sum()))
+    with m2:
+        st.metric("追加アイデア", int(ideas_per_week["追加アイデア"].sum()))
+    with m3:
+        st.metric("プロジェクト活動", int(project_heatmap["count"].sum()) if not project_heatmap.empty else 0)
+
+    st.subheader("✅ 完了タスク数 / 日")
+    st.bar_chart(tasks_per_day)
+
+    st.subheader("💡 アイデア追加数 / 週")
+    st.bar_chart(ideas_per_week)
+
+    st.subheader("🔥 プロジェクト活動ヒートマップ")
+    if project_heatmap.empty:
+        st.info("期間内のプロジェクト活動はありません。")
+    else:
+        import altair as alt
+        heatmap = alt.Chart(project_heatmap).mark_rect().encode(
+            x=alt.X("period:T", title="期間"),
+            y=alt.Y("project:N", title="プロジェクト"),
+            color=alt.Color("count:Q", title="活動数", scale=alt.Scale(scheme="tealblues")),
+            tooltip=["project:N", "period:T", "count:Q"],
+        )
+        st.altair_chart(heatmap, use_container_width=True)
+
+
+def iter_idea_import_records(uploaded_file):
+    """アップロードされたCSV/JSONLを1行ずつ読み、(content, created_at) を順に返す
+    - CSV: content（旧形式のtitle）列とcreated_at列を見る。どちらも無ければid/created_at以外の最初の列を内容とみなす
+      1行目に既知の列名（IDEA_IMPORT_KNOWN_COLUMNS）が1つも無ければヘッダー無しとして1列目を内容とみなす
+    - JSONL: 1行1オブジェクト（content/title, created_at）または文字列"""
+    text = io.TextIOWrapper(uploaded_file, encoding="utf-8-sig", newline="")
+    try:
+        if uploaded_file.name.lower().endswith((".jsonl", ".ndjson")):
+            for line in text:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, str):
+                    yield record, ""
+                elif isinstance(record, dict):
+                    yield str(record.get("content") or record.get("title") or ""), str(record.get("created_at") or "")
+        else:
+            reader = csv.reader(text)
+            header = next(reader, None)
+            if header is None:
+                return
+            columns = [h.strip().lower() for h in header]
+            if not any(c in IDEA_IMPORT_KNOWN_COLUMNS for c in columns):
+                # ヘッダー無しのCSVは1行目からデータとして扱う
+                content_col, created_col = 0, None
+                yield header[0] if header else "", ""
+            else:
+                content_col = next((columns.index(c) for c in ("content", "title") if c in columns), None)
+                if content_col is None:
+                    content_col = next((i for i, c in enumerate(columns) if c not in IDEA_IMPORT_KNOWN_COLUMNS), None)
+                    if content_col is None:
+                        return
+                created_col = columns.index("created_at") if "created_at" in columns else None
+            for row in reader:
+                content = row[content_col] if len(row) > content_col else ""
+                created = row[created_col] if created_col is not None and len(row) > created_col else ""
+                yield content, created
+    finally:
+        # アップロードファイル自体は閉じない
+        text.detach()
+
+def import_ideas(manager, records, chunk_size=IDEA_IMPORT_CHUNK_ROWS):
+    """読み込んだアイデアをチャンク単位でまとめて登録し、登録件数を返す
+    IDはアイデア・活動履歴ともにチャンクごとに書き込み前に確保し、連番で割り当てる
+    途中で読み込み・書き込みに失敗した場合は、それまでに登録した件数を返す"""
+    imported = 0
+    try:
+        headers = manager.get_table("ideas")[0]
+        records = ((content.strip(), created) for content, created in records)
+        records = ((content, created) for content, created in records if content)
+        while True:
+            chunk = []
+            for content, created in records:
+                created_at = pd.to_datetime(created, errors="coerce") if created else pd.NaT
+                # タイムゾーン付きの日時は日本時間に直して保存する
+                if not pd.isna(created_at) and created_at.tzinfo is not None:
+                    created_at = created_at.tz_convert('Asia/Tokyo')
+                chunk.append((content, get_now_jst() if pd.isna(created_at) else created_at.strftime('%Y-%m-%d %H:%M:%S')))
+                if len(chunk) >= chunk_size:
+                    break
+            if not chunk:
+                break
+
+            # 書き込み中に他のセッションが同じIDを採番しないよう、先にIDを確保する
+            next_id = manager.reserve_ids("ideas", len(chunk))
+            next_history_id = manager.reserve_ids("activity_history", len(chunk))
+            rows = [[next_id + i, content, created_at] for i, (content, created_at) in enumerate(chunk)]
+            if not manager.add_rows("ideas", rows, headers=headers):
+                break
+            manager.add_activity_histories([{
+                "action_type": "アイデア追加",
+                "entity_type": "ideas",
+                "entity_id": row[0],
+                "entity_name": row[1][:50] + "..." if len(row[1]) > 50 else row[1],
+                "new_value": row[1],
+                "details": "一括インポート",
+            } for row in rows], first_id=next_history_id)
+            imported += len(rows)
+    except Exception as e:
+        st.error(f"インポートエラー: {e}")
+    return imported
+
+def iter_ideas_export(df_ideas, fmt):
+    """アイデアをCSV/JSONLの1行ずつの文字列として順に返す"""
+    columns = [c for c in ("id", "content", "created_at") if c in df_ideas.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(columns)
+        yield buffer.getvalue()
+    for values in df_ideas[columns].itertuples(index=False, name=None):
+        record = dict(zip(columns, values))
+        if isinstance(record.get("created_at"), pd.Timestamp):
+            record["created_at"] = record["created_at"].strftime('%Y-%m-%d %H:%M:%S')
+        elif pd.isna(record.get("created_at", "")):
+            record["created_at"] = ""
+        if fmt == "csv":
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow([record[c] for c in columns])
+            yield buffer.getvalue()
+        else:
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+@st.cache_data(max_entries=4)
+def build_ideas_export(_manager, data_version, fmt):
+    """エクスポート用のファイル内容を行ごとにエンコードして組み立てる（data_versionが変わるまで再利用）"""
+    _, df_ideas = _manager.get_table("ideas")
+    output = io.BytesIO()
+    # CSVはExcelで開けるようBOM付きにする
+    output.write(b"\xef\xbb\xbf" if fmt == "csv" else b"")
+    for line in iter_ideas_export(df_ideas, fmt):
+        output.write(line.encode("utf-8"))
+    return output.getvalue()
+
+def render_idea_import_export(manager):
+    """アイデアのCSV/JSONL一括インポート・エクスポート"""
+    with st.expander("📤 インポート / エクスポート", expanded=False):
+        col_import, col_export = st.columns(2)
+        with col_import:
+            uploaded = st.file_uploader("CSV / JSONL を読み込む", type=["csv", "jsonl", "ndjson"], key="idea_import_file")
+            if uploaded is not None and st.button("インポートする", key="idea_import_btn", use_container_width=True):
+                # 同じアップロードの再送で二重に登録しない
+                import_key = make_idempotency_key("idea_import", getattr(uploaded, "file_id", uploaded.name), uploaded.size)
+                if not manager.idempotency.claim(import_key):
+                    st.info("このファイルはすでにインポート済みです。")
+                    return
+                with st.spinner("インポート中..."):
+                    count = import_ideas(manager, iter_idea_import_records(uploaded))
+                if not count:
+                    # 1件も書き込めなかった場合は、同じファイルで再試行できるようキーを解放する
+                    manager.idempotency.release(import_key)
+                    st.warning("登録できるアイデアがありませんでした。")
+                    return
+                add_log(f"アイデア一括インポート: {count}件")
+                st.success(f"{count}件のアイデアを登録しました！")
+                time.sleep(0.5)
+                st.rerun()
+        with col_export:
+            fmt = st.radio("形式", ["csv", "jsonl"], horizontal=True, key="idea_export_format")
+            # ファイルは押されたときだけ組み立てる（書き込みのたびに全件を作り直さない）
+            if st.button("エクスポートを準備", key="idea_export_prepare", use_container_width=True):
+                st.session_state["idea_export_prepared"] = (fmt, manager.data_version)
+            if st.session_state.get("idea_export_prepared") == (fmt, manager.data_version):
+                st.download_button(
+                    "ダウンロード",
+                    data=build_ideas_export(manager, manager.data_version, fmt),
+                    file_name=f"ideas_{get_now_jst()[:10]}.{fmt}",
+                    mime="text/csv" if fmt == "csv" else "application/x-ndjson",
+                    use_container_width=True,
+                    key="idea_export_btn",
+                )
+
+@st.cache_data(max_entries=8)
+def build_idea_view_index(df_ideas):
+    """アイデア一覧の表示用インデックスを作る
+    戻り値: {"by_date": 登録日時の新しい順の行位置リスト, "position_by_id": {id: 行位置}}"""
+    positions = pd.Series(range(len(df_ideas)), index=df_ideas.index)
+
+    # 日付があれば新しい順に
+    if "created_at" in df_ideas.columns:
+        try:
+            created_at = pd.to_datetime(df_ideas["created_at"])
+            positions = positions[created_at.sort_values(ascending=False).index]
+        except Exception:
+            pass
+
+    position_by_id = {}
+    if "id" in df_ideas.columns:
+        position_by_id = {idea_id: pos for pos, idea_id in enumerate(df_ideas["id"].astype(str))}
+    return {"by_date": positions.tolist(), "position_by_id": position_by_id}
+
 def render_assets_and_ideas(manager):
     """資産・アイデアBOX画面"""
     st.title("📦 資産・アイデアBOX")
@@ -1788,28 +4160,13 @@ def render_assets_and_ideas(manager):
 
     # --- アイデア一覧タブ ---
     with tab_ideas:
-        # ideasシートを直接読み込み（ヘッダー行を明示的に扱う）
-        try:
-            ideas_sheet = manager.spreadsheet.worksheet("ideas")
-            values = ideas_sheet.get_all_values()
-        except gspread.exceptions.WorksheetNotFound:
-            values = []
-        except Exception as e:
-            st.error(f"ideasシートの読み込みでエラーが発生しました: {e}")
-            values = []
+        # ideasシートをキャッシュ経由で取得（content列・created_at型は揃え済み）
+        headers, df_ideas = manager.get_table("ideas")
 
-        # 1行目をヘッダーとして解釈し、2行目以降をデータとして扱う
-        if not values or len(values) <= 1:
+        if df_ideas.empty:
             st.info("まだアイデアが登録されていません。右上のボタンやダッシュボードから登録できます。")
+            render_idea_import_export(manager)
         else:
-            headers = values[0]
-            rows = values[1:]
-            df_ideas = pd.DataFrame(rows, columns=headers)
-
-            # 期待するカラム名を揃える（ユーザー要望: id, content, created_at）
-            if "content" not in df_ideas.columns and "title" in df_ideas.columns:
-                df_ideas.rename(columns={"title": "content"}, inplace=True)
-
             # --- 一覧表示をメインに ---
             # フォーム開閉フラグの初期化
             if "show_assets_idea_form" not in st.session_state:
@@ -1834,9 +4191,12 @@ def render_assets_and_ideas(manager):
                     new_content = st.text_area("アイデア内容 (必須)", height=4)
                     submitted_new = st.form_submit_button("このアイデアを登録する", use_container_width=True)
                     if submitted_new:
-                        if new_content:
+                        write_key = make_idempotency_key("idea_add_from_assets", new_content)
+                        if manager.is_replay(write_key):
+                            st.info("同じ内容はすでに登録済みです。")
+                        elif new_content:
                             new_id = manager.get_next_id("ideas")
-                            ok = manager.add_row("ideas", [new_id, new_content, get_now_jst()])
+                            ok = manager.add_row("ideas", [new_id, new_content, get_now_jst()], idempotency_key=write_key)
                             if ok:
                                 # 活動履歴に記録
                                 manager.add_activity_history(
@@ -1846,7 +4206,8 @@ def render_assets_and_ideas(manager):
                                     entity_name=new_content[:50] + "..." if len(new_content) > 50 else new_content,
                                     old_value="",
                                     new_value=new_content,
-                                    details=""
+                                    details="",
+                                    idempotency_key=f"{write_key}:history"
                                 )
                                 add_log(f"新規アイデア追加(ASSETS): {new_content[:20]}...")
                                 st.success("アイデアを登録しました！")
@@ -1857,30 +4218,40 @@ def render_assets_and_ideas(manager):
                             st.error("アイデア内容を入力してください。")
                 st.markdown("---")
 
+            render_idea_import_export(manager)
+
             # フィルタUI
-            keyword = st.text_input("キーワードで絞り込み", placeholder="アイデア内容から検索")
+            keyword = st.text_input("キーワードで絞り込み", placeholder="アイデア内容から検索", key="ideas_keyword")
+            # まとめて削除モード（選択はページをまたいで保持する）
+            bulk_mode = st.checkbox("☑ まとめて削除", key="ideas_bulk_mode")
+            selected_ids = st.session_state.setdefault("ideas_selected", set())
 
-            # 絞り込み処理（contentカラム前提 / なければスキップ）
-            if "content" in df_ideas.columns and keyword:
-                mask = df_ideas["content"].astype(str).str.contains(keyword, case=False)
-                df_ideas = df_ideas[mask]
+            # 絞り込みは転置インデックス（関連度順）、未入力時は登録日時の新しい順
+            # いずれも行位置のリストにしてから、表示中のページ分だけを取り出す
+            idea_view = build_idea_view_index(df_ideas)
+            if keyword:
+                position_by_id = idea_view["position_by_id"]
+                hits = get_idea_search_index(manager).search(keyword)
+                view_index = [position_by_id[idea_id] for idea_id in hits if idea_id in position_by_id]
+            else:
+                view_index = idea_view["by_date"]
 
-            # 日付があれば新しい順に
-            if "created_at" in df_ideas.columns:
-                try:
-                    df_ideas["created_at"] = pd.to_datetime(df_ideas["created_at"])
-                    df_ideas = df_ideas.sort_values("created_at", ascending=False)
-                except Exception:
-                    pass
+            # キーワードが変わったら先頭ページに戻す
+            if st.session_state.get("ideas_last_keyword") != keyword:
+                st.session_state["ideas_last_keyword"] = keyword
+                st.session_state["ideas_page"] = 0
 
             # 行ごとに削除ボタン付きで表示（IDは内部用としてのみ使用）
-            if df_ideas.empty:
+            if not view_index:
                 st.info("該当するアイデアがありません。")
             else:
-                for idx, row in df_ideas.iterrows():
+                start, end = render_pager(len(view_index), "ideas_page", IDEA_PAGE_SIZE)
+                page_ideas = df_ideas.iloc[view_index[start:end]]
+                for idx, (_, row) in enumerate(page_ideas.iterrows()):
                     idea_id = row.get("id", "")
                     content = row.get("content", "")
                     created = row.get("created_at", "")
+                    created = created.strftime('%Y-%m-%d %H:%M:%S') if isinstance(created, pd.Timestamp) else ""
                     
                     # 編集中のアイデアIDを管理
                     edit_key = f"idea_edit_{idea_id}"
@@ -1927,6 +4298,12 @@ def render_assets_and_ideas(manager):
                             st.markdown(f"{content}")
                             if created:
                                 st.caption(f"登録日時: {created}")
+                        if bulk_mode:
+                            with cols[1]:
+                                if st.checkbox("選択", value=str(idea_id) in selected_ids, key=f"idea_sel_{idea_id}"):
+                                    selected_ids.add(str(idea_id))
+                                else:
+                                    selected_ids.discard(str(idea_id))
                         with cols[2]:
                             if st.button("編集", key=f"idea_edit_btn_{idea_id}"):
                                 st.session_state[edit_key] = True
@@ -1934,7 +4311,14 @@ def render_assets_and_ideas(manager):
                         with cols[3]:
                             if st.button("削除", key=f"idea_del_{idea_id}"):
                                 if idea_id:
-                                    ok = manager.delete_row_by_id("ideas", idea_id)
+                                    # 論理削除と活動履歴の追記を1回のbatchUpdateで反映する
+                                    ok = manager.delete_rows_by_ids("ideas", [idea_id], history=[{
+                                        "action_type": "アイデア削除",
+                                        "entity_type": "ideas",
+                                        "entity_id": idea_id,
+                                        "entity_name": content[:50] + "..." if len(content) > 50 else content,
+                                        "old_value": content,
+                                    }]) > 0
                                     if ok:
                                         add_log(f"アイデア削除: id={idea_id}")
                                         st.success("アイデアを削除しました。")
@@ -1945,6 +4329,25 @@ def render_assets_and_ideas(manager):
                     if idx != 0:
                         st.markdown("---")
 
+                if bulk_mode and selected_ids:
+                    if st.button(f"🗑️ 選択したアイデアを削除 ({len(selected_ids)}件)", key="ideas_bulk_delete", type="primary"):
+                        # 削除と活動履歴の追記を1回のbatchUpdateで反映する
+                        contents = df_ideas.set_index(df_ideas["id"].astype(str))["content"]
+                        targets = sorted(selected_ids)
+                        deleted = manager.delete_rows_by_ids("ideas", targets, history=[{
+                            "action_type": "アイデア削除",
+                            "entity_type": "ideas",
+                            "entity_id": idea_id,
+                            "entity_name": contents.get(idea_id, "")[:50],
+                            "old_value": contents.get(idea_id, ""),
+                            "details": "一括削除",
+                        } for idea_id in targets if idea_id in contents.index])
+                        selected_ids.clear()
+                        add_log(f"アイデア一括削除: {deleted}件")
+                        st.success(f"{deleted}件のアイデアを削除しました。")
+                        time.sleep(0.3)
+                        st.rerun()
+
     # --- その他の資産タブ（将来拡張用） ---
     with tab_assets:
         st.info("今後、プロンプト集やテンプレートなどの資産をここに整理していく予定です。")
@@ -1953,9 +4356,12 @@ def render_assets_and_ideas(manager):
 # 6. メイン実行関数
 # ==========================================
 def main():
-    inject_custom_css()
-    inject_warpgate_scroll_script()
+    inject_static_assets()
     manager = get_sheet_manager()
+    # 他のレプリカの書き込み・シートの外部更新があればキャッシュを破棄する（バージョンと最終更新日時の確認のみ）
+    manager.sync_shared_cache()
+    manager.check_for_updates()
+    run_periodic_maintenance(manager)
     
     # サイドバーナビゲーション
     with st.sidebar:
@@ -1974,6 +4380,8 @@ def main():
             st.session_state['current_page'] = "ASSETS"
         if st.button("📝 レポート出力", use_container_width=True):
             st.session_state['current_page'] = "REPORT"
+        if st.button("📈 アナリティクス", use_container_width=True):
+            st.session_state['current_page'] = "ANALYTICS"
             
         render_warp_gate_trigger(manager)
     
@@ -1988,6 +4396,8 @@ def main():
         render_assets_and_ideas(manager)
     elif page == "REPORT":
         render_report_generator(manager)
+    elif page == "ANALYTICS":
+        render_analytics(manager)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file